@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import requests
+from dotenv import load_dotenv
+
+from src.transactions import AMOUNT_COLUMN, DATE_COLUMN, TransactionFrame, as_transaction_frame
+from src.utils import http_get
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+logger.addHandler(stream_handler)
+
+CURRENCY_COLUMN = "Валюта операции"
+PAYMENT_AMOUNT_COLUMN = "Сумма платежа"
+PAYMENT_CURRENCY_COLUMN = "Валюта платежа"
+
+# Колонка, в которой сохраняется сумма в валюте операции до пересчета в рубли
+ORIGINAL_AMOUNT_COLUMN = "Сумма операции в валюте операции"
+
+BASE_CURRENCY = "RUB"
+
+# Файл с историческими курсами: курс валюты к рублю по датам и загруженный диапазон по каждой валюте
+FX_CACHE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "fx_rates.json")
+
+# Максимальный период одного запроса timeseries к apilayer
+TIMESERIES_MAX_DAYS = 365
+
+# Насколько старый курс можно использовать для дат без курса (выходные, праздники)
+RATE_TOLERANCE = pd.Timedelta(days=7)
+
+
+def _load_fx_cache() -> dict:
+    """Загружает кэш исторических курсов"""
+    try:
+        with open(FX_CACHE_PATH, "r", encoding="utf-8") as file:
+            cache: dict = json.load(file)
+            return cache
+    except (OSError, ValueError):
+        return {"rates": {}, "covered": {}}
+
+
+def _save_fx_cache(cache: dict) -> None:
+    """Сохраняет кэш исторических курсов атомарной заменой файла"""
+    os.makedirs(os.path.dirname(FX_CACHE_PATH), exist_ok=True)
+    tmp_path = f"{FX_CACHE_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(cache, file)
+    os.replace(tmp_path, FX_CACHE_PATH)
+
+
+def _fetch_timeseries(currencies: list[str], start: str, end: str, api_key: str) -> dict[str, dict[str, float]]:
+    """Загружает курсы валют к рублю за период, разбивая его на допустимые для API отрезки"""
+    rates: dict[str, dict[str, float]] = {}
+    period_start = datetime.strptime(start, "%Y-%m-%d")
+    period_end = datetime.strptime(end, "%Y-%m-%d")
+    while period_start <= period_end:
+        chunk_end = min(period_start + timedelta(days=TIMESERIES_MAX_DAYS - 1), period_end)
+        params = {
+            "start_date": period_start.strftime("%Y-%m-%d"),
+            "end_date": chunk_end.strftime("%Y-%m-%d"),
+            "symbols": ",".join(currencies),
+            "base": BASE_CURRENCY,
+        }
+        response = http_get(
+            "https://api.apilayer.com/exchangerates_data/timeseries", params=params, headers={"apikey": api_key}
+        )
+        response.raise_for_status()
+        for day, day_rates in response.json()["rates"].items():
+            rates.setdefault(day, {}).update(day_rates)
+        period_start = chunk_end + timedelta(days=1)
+    return rates
+
+
+def _missing_periods(covered: Optional[list[str]], start: str, end: str) -> list[tuple[str, str]]:
+    """Возвращает края периода start - end вне загруженного периода валюты; загруженный период остается сплошным"""
+    if not covered:
+        return [(start, end)]
+
+    periods = []
+    covered_start = datetime.strptime(covered[0], "%Y-%m-%d")
+    covered_end = datetime.strptime(covered[1], "%Y-%m-%d")
+    if start < covered[0]:
+        periods.append((start, (covered_start - timedelta(days=1)).strftime("%Y-%m-%d")))
+    if end > covered[1]:
+        periods.append(((covered_end + timedelta(days=1)).strftime("%Y-%m-%d"), end))
+    return periods
+
+
+def get_historical_rates(currencies: list[str], start: str, end: str) -> pd.DataFrame:
+    """Возвращает курсы валют к рублю за период (колонки date, currency, rate), догружая недостающие в кэш"""
+    currencies = sorted(set(currencies) - {BASE_CURRENCY})
+    cache = _load_fx_cache()
+
+    # Для каждой валюты догружаются только края периода, которых нет в кэше; валюты с одинаковыми краями
+    # запрашиваются вместе
+    ranges: dict[tuple[str, str], list[str]] = {}
+    for currency in currencies:
+        for period in _missing_periods(cache["covered"].get(currency), start, end):
+            ranges.setdefault(period, []).append(currency)
+    if ranges:
+        api_key = os.getenv("API_KEY")
+        if not api_key:
+            logger.error("Ошибка: API-ключ не установлен.")
+        else:
+            failed: set[str] = set()
+            for (fetch_start, fetch_end), symbols in sorted(ranges.items()):
+                try:
+                    fetched = _fetch_timeseries(symbols, fetch_start, fetch_end, api_key)
+                except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                    logger.error(f"Ошибка при загрузке исторических курсов: {e}")
+                    failed.update(symbols)
+                    continue
+                for day, day_rates in fetched.items():
+                    cache["rates"].setdefault(day, {}).update(day_rates)
+                logger.info(f"Загружены курсы {symbols} за {fetch_start} - {fetch_end}")
+
+            # Покрытый период расширяется только для валют, все края которых загружены
+            for currency in {currency for symbols in ranges.values() for currency in symbols} - failed:
+                covered = cache["covered"].get(currency, [start, end])
+                cache["covered"][currency] = [min(start, covered[0]), max(end, covered[1])]
+            _save_fx_cache(cache)
+
+    records = [
+        (day, currency, rate)
+        for day, day_rates in cache["rates"].items()
+        for currency, rate in day_rates.items()
+        if currency in currencies and rate
+    ]
+    rates = pd.DataFrame(records, columns=["date", "currency", "rate"])
+    rates["date"] = pd.to_datetime(rates["date"], format="%Y-%m-%d")
+    return rates.sort_values("date", ignore_index=True)
+
+
+def convert_to_rub(
+    transactions: Union[pd.DataFrame, TransactionFrame], rates: Optional[pd.DataFrame] = None
+) -> TransactionFrame:
+    """Пересчитывает суммы операций в рубли по курсу на дату каждой операции"""
+    frame = as_transaction_frame(transactions)
+    data = frame.data
+    if CURRENCY_COLUMN not in data.columns or AMOUNT_COLUMN not in data.columns:
+        return frame
+
+    currencies = data[CURRENCY_COLUMN].astype(object).fillna(BASE_CURRENCY)
+    foreign = (currencies != BASE_CURRENCY).to_numpy() & data[DATE_COLUMN].notna().to_numpy()
+    if not foreign.any():
+        return frame
+
+    dates = data[DATE_COLUMN].dt.normalize()
+    if rates is None:
+        rates = get_historical_rates(
+            currencies[foreign].unique().tolist(),
+            dates[foreign].min().strftime("%Y-%m-%d"),
+            dates[foreign].max().strftime("%Y-%m-%d"),
+        )
+
+    # Все валютные операции соединяются с курсами одним merge_asof: берется последний курс не позже даты операции
+    positions = np.flatnonzero(foreign)
+    left = pd.DataFrame(
+        {"position": positions, "date": dates.to_numpy()[positions], "currency": currencies.to_numpy()[positions]}
+    )
+    left = left.sort_values("date", kind="stable")
+    right = rates.astype({"currency": object}).sort_values("date", kind="stable")
+    matched = pd.merge_asof(left, right, on="date", by="currency", direction="backward", tolerance=RATE_TOLERANCE)
+
+    amounts = data[AMOUNT_COLUMN].to_numpy(dtype="float64")
+    converted = amounts.copy()
+    # Курсы apilayer с базой RUB показывают, сколько единиц валюты стоит один рубль
+    converted[matched["position"].to_numpy()] = amounts[matched["position"].to_numpy()] / matched["rate"].to_numpy()
+
+    # Для операций без курса используется сумма платежа, если она в рублях, иначе сумма остается прежней
+    unmatched = matched["position"].to_numpy()[matched["rate"].isna().to_numpy()]
+    if len(unmatched):
+        fallback = np.full(len(unmatched), np.nan)
+        if PAYMENT_AMOUNT_COLUMN in data.columns and PAYMENT_CURRENCY_COLUMN in data.columns:
+            is_rub = (data[PAYMENT_CURRENCY_COLUMN].astype(object).to_numpy()[unmatched] == BASE_CURRENCY).astype(bool)
+            fallback[is_rub] = data[PAYMENT_AMOUNT_COLUMN].to_numpy(dtype="float64")[unmatched][is_rub]
+        converted[unmatched] = np.where(np.isnan(fallback), amounts[unmatched], fallback)
+        logger.warning(f"Нет курса для {len(unmatched)} операций, использована сумма платежа или исходная сумма")
+
+    result = data.copy()
+    result[ORIGINAL_AMOUNT_COLUMN] = amounts
+    result[AMOUNT_COLUMN] = converted
+    logger.info(f"Пересчитано в рубли {len(positions)} валютных операций")
+    return TransactionFrame(result)
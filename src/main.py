@@ -1,12 +1,15 @@
 import json
 import logging
-from typing import Optional
+from typing import Optional, Union
 
 import pandas as pd
 from dotenv import load_dotenv
 
-from src.reports import spending_by_category
+from src.currency import convert_to_rub
+from src.reports import build_spending_by_category, write_report_in_background
 from src.services import search_transactions
+from src.storage import TransactionStore
+from src.transactions import TransactionFrame, as_transaction_frame, to_plain_frame
 from src.views import main_first
 
 load_dotenv()
@@ -21,19 +24,29 @@ logger.addHandler(stream_handler)
 
 
 def main(
-    transactions: pd.DataFrame, date_time_str: str, search_query: Optional[str] = None, category: Optional[str] = None
+    transactions: Union[pd.DataFrame, TransactionFrame, TransactionStore],
+    date_time_str: str,
+    search_query: Optional[str] = None,
+    category: Optional[str] = None,
+    convert_currency: bool = True,
+    report_file: Optional[str] = None,
 ) -> dict:
     logging.info("Начинаем анализ транзакций.")
 
-    # Преобразование формата даты в DataFrame
-    transactions["Дата операции"] = pd.to_datetime(
-        transactions["Дата операции"], format="%d.%m.%Y %H:%M:%S", errors="coerce"
-    )
+    # Хранилище передается дальше как есть: функции выполняют фильтры прямо в нем или берут готовые агрегаты;
+    # суммы в нем уже пересчитаны в рубли при добавлении выписок
+    if not isinstance(transactions, TransactionStore):
+        # Нормализация данных один раз, дальше все функции получают уже разобранные даты и суммы
+        transactions = as_transaction_frame(transactions)
 
-    # Убедитесь, что данные не содержат NaT после преобразования
-    if transactions["Дата операции"].isnull().any():
-        logging.warning("Некоторые даты не были преобразованы. Проверьте данные.")
-        transactions = transactions.dropna(subset=["Дата операции"])
+        # Убедитесь, что данные не содержат NaT после преобразования
+        if transactions.data["Дата операции"].isnull().any():
+            logging.warning("Некоторые даты не были преобразованы. Проверьте данные.")
+            transactions = transactions.dropna_dates()
+
+        # Валютные операции пересчитываются в рубли по курсу на дату операции, чтобы итоги складывались в одной валюте
+        if convert_currency:
+            transactions = convert_to_rub(transactions)
 
     # Поиск транзакций
     if search_query:
@@ -43,21 +56,18 @@ def main(
         search_results = []
 
     # Отчет по категории
-    report_df = pd.DataFrame()
+    report_records = []
     if category:
-        # Вызов обернутой функции spending_by_category и получение имени файла
-        report_file_name = spending_by_category(transactions, category, date_time_str)
-
-        # Проверка, что файл был создан и загрузка JSON-файла
+        # Отчет строится в памяти без записи в файл и повторного чтения
         try:
-            # Ожидание, что декоратор вернул имя файла
-            with open(report_file_name, "r", encoding="utf-8") as f:
-                report_json_str = f.read()
-            report_df = pd.read_json(report_json_str, orient="records")
-        except FileNotFoundError:
-            logging.error(f"Не удалось найти файл отчета: {report_file_name}")
+            report_df = build_spending_by_category(transactions, category, date_time_str)
+            report_records = to_plain_frame(report_df, "%Y-%m-%d").to_dict(orient="records")
+
+            # Сохранение в файл по желанию выполняется в фоне
+            if report_file:
+                write_report_in_background(report_df, report_file)
         except Exception as e:
-            logging.error(f"Ошибка при чтении файла отчета: {e}")
+            logging.error(f"Ошибка при построении отчета по категории: {e}")
 
     # Получение данных для main_first
     try:
@@ -75,7 +85,7 @@ def main(
     # Результат в формате JSON
     result = {
         "search_transactions": search_results,
-        "spending_by_category": report_df.to_dict(orient="records"),
+        "spending_by_category": report_records,
         "main_first": main_first_data,
     }
 
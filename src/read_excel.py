@@ -1,7 +1,33 @@
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+from typing import Iterator, Optional
+
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
+# Числовые колонки выгрузки, которые приводятся к float при потоковом чтении
+NUMERIC_COLUMNS = [
+    "Сумма операции",
+    "Сумма платежа",
+    "Кэшбэк",
+    "MCC",
+    "Бонусы (включая кэшбэк)",
+    "Округление на инвесткопилку",
+    "Сумма операции с округлением",
+]
+
+# Форматы файла-кэша и расширения их файлов данных; pickle исполняет код при загрузке, поэтому включается только явно
+CACHE_FORMATS = {"parquet": "parquet", "pickle": "pkl"}
+
+# Статистика работы кэша excel-файлов
+_cache_stats = {"hits": 0, "misses": 0, "bytes_loaded": 0}
 
-def read_excel_file(file_name: str):
+
+def read_excel_file(file_name: str) -> pd.DataFrame:
     """Считывает данные из excel-файла и преобразовывает их в формат JSON"""
     try:
         df = pd.read_excel(file_name)
@@ -10,6 +36,190 @@ def read_excel_file(file_name: str):
         raise RuntimeError(f"Ошибка при чтении файла {file_name}: {str(e)}")
 
 
+def _file_hash(file_name: str) -> str:
+    """Считает sha256 содержимого файла"""
+    sha = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _cache_dir(file_name: str, cache_dir: Optional[str] = None) -> str:
+    """Возвращает каталог кэша: переданный или каталог исходного файла"""
+    return cache_dir if cache_dir else os.path.dirname(os.path.abspath(file_name))
+
+
+def _cache_paths(file_name: str, cache_dir: Optional[str] = None, cache_format: str = "parquet") -> tuple[str, str]:
+    """Возвращает пути к файлу данных и файлу метаданных кэша"""
+    directory = _cache_dir(file_name, cache_dir)
+    base_name = os.path.basename(file_name)
+    data_path = os.path.join(directory, f".{base_name}.cache.{CACHE_FORMATS[cache_format]}")
+    return data_path, os.path.join(directory, f".{base_name}.cache.json")
+
+
+def _default_cache_format() -> Optional[str]:
+    """Возвращает parquet, если установлен pyarrow, иначе None (кэш не используется)"""
+    return "parquet" if importlib.util.find_spec("pyarrow") is not None else None
+
+
+def _read_cache_data(data_path: str, cache_format: str) -> pd.DataFrame:
+    """Загружает данные из файла-кэша в заданном формате"""
+    if cache_format == "pickle":
+        df: pd.DataFrame = pd.read_pickle(data_path)
+        return df
+    return pd.read_parquet(data_path)
+
+
+def _write_cache_data(df: pd.DataFrame, data_path: str, cache_format: str) -> None:
+    """Сохраняет данные в файл-кэш в заданном формате"""
+    if cache_format == "pickle":
+        df.to_pickle(data_path)
+    else:
+        df.to_parquet(data_path, index=True)
+
+
+def _load_cache_meta(meta_path: str) -> Optional[dict]:
+    """Загружает метаданные кэша, если они есть"""
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta: dict = json.load(f)
+            return meta
+    except (OSError, ValueError):
+        return None
+
+
+def read_excel_cached(
+    file_name: str, cache_dir: Optional[str] = None, cache_format: Optional[str] = None
+) -> pd.DataFrame:
+    """Считывает excel-файл через файл-кэш, чтобы не разбирать xlsx при повторных запусках"""
+    if cache_format is None:
+        cache_format = _default_cache_format()
+        if cache_format is None:
+            logger.info(f"pyarrow не установлен, {file_name} читается без кэша")
+            return read_excel_file(file_name)
+    elif cache_format not in CACHE_FORMATS:
+        raise ValueError(f"Неизвестный формат кэша: {cache_format}")
+
+    try:
+        stat = os.stat(file_name)
+    except OSError as e:
+        raise RuntimeError(f"Ошибка при чтении файла {file_name}: {str(e)}")
+
+    data_path, meta_path = _cache_paths(file_name, cache_dir, cache_format)
+    abs_path = os.path.abspath(file_name)
+    meta = _load_cache_meta(meta_path)
+
+    # Кэш действителен, если совпадают путь, формат, размер и время изменения либо содержимое файла
+    is_valid = False
+    if meta and meta.get("path") == abs_path and meta.get("format") == cache_format and os.path.exists(data_path):
+        if meta.get("size") == stat.st_size and meta.get("mtime_ns") == stat.st_mtime_ns:
+            is_valid = True
+        elif meta.get("size") == stat.st_size and meta.get("sha256") == _file_hash(file_name):
+            # Файл перезаписан без изменений, обновляем время изменения в метаданных
+            meta["mtime_ns"] = stat.st_mtime_ns
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            is_valid = True
+
+    if is_valid:
+        try:
+            df = _read_cache_data(data_path, cache_format)
+            _cache_stats["hits"] += 1
+            _cache_stats["bytes_loaded"] += os.path.getsize(data_path)
+            logger.info(f"Данные {file_name} загружены из кэша {data_path}")
+            return df
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш {data_path}: {e}")
+
+    _cache_stats["misses"] += 1
+    df = read_excel_file(file_name)
+
+    try:
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        _write_cache_data(df, data_path, cache_format)
+        meta = {
+            "path": abs_path,
+            "format": cache_format,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": _file_hash(file_name),
+        }
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        logger.info(f"Кэш для {file_name} сохранен в {data_path}")
+    except Exception as e:
+        # Например, колонки со смешанными типами, которые parquet не сохраняет
+        logger.warning(f"Не удалось сохранить кэш для {file_name}: {e}")
+        if os.path.exists(data_path):
+            os.remove(data_path)
+
+    return df
+
+
+def invalidate_excel_cache(file_name: str, cache_dir: Optional[str] = None) -> bool:
+    """Удаляет кэш excel-файла, возвращает True, если кэш был"""
+    removed = False
+    paths = {path for cache_format in CACHE_FORMATS for path in _cache_paths(file_name, cache_dir, cache_format)}
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed = True
+    return removed
+
+
+def _typed_chunk(rows: list[tuple], columns: list[str]) -> pd.DataFrame:
+    """Собирает DataFrame из строк листа и приводит числовые колонки к float"""
+    chunk = pd.DataFrame.from_records(rows, columns=columns)
+    for column in NUMERIC_COLUMNS:
+        if column in chunk.columns:
+            chunk[column] = pd.to_numeric(chunk[column], errors="coerce").astype("float64")
+    return chunk
+
+
+def read_excel_chunks(file_name: str, chunk_size: int = 10000) -> Iterator[pd.DataFrame]:
+    """Построчно читает excel-файл и отдает данные частями по chunk_size строк"""
+    if chunk_size <= 0:
+        raise ValueError("Размер части должен быть положительным")
+
+    # openpyxl нужен только потоковому чтению, поэтому импортируется при вызове
+    from openpyxl import load_workbook  # type: ignore[import-untyped]
+
+    try:
+        workbook = load_workbook(file_name, read_only=True, data_only=True)
+    except Exception as e:
+        raise RuntimeError(f"Ошибка при чтении файла {file_name}: {str(e)}")
+
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(column) for column in header]
+
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunk_size:
+                yield _typed_chunk(buffer, columns)
+                buffer = []
+        if buffer:
+            yield _typed_chunk(buffer, columns)
+    finally:
+        workbook.close()
+
+
+def get_excel_cache_stats() -> dict:
+    """Возвращает статистику кэша: попадания, промахи и объем загруженных данных"""
+    return dict(_cache_stats)
+
+
+def reset_excel_cache_stats() -> None:
+    """Сбрасывает статистику кэша"""
+    for key in _cache_stats:
+        _cache_stats[key] = 0
+
+
 # if __name__ == "__main__":
 #     file_name = "../data/operations.xlsx"
 #
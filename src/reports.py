@@ -1,48 +1,155 @@
 import json
 import logging
+import textwrap
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from functools import wraps
-from typing import Optional
+from functools import partial, wraps
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
 
+import numpy as np
 import pandas as pd
 
+from src.storage import TransactionStore
+from src.transactions import TransactionFrame, as_transaction_frame, to_plain_frame
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 
-def report_to_file(file_name: Optional[str] = None):
+# Форматы отчета и расширения файлов по умолчанию
+REPORT_FORMATS = {"json": "json", "json_compact": "json", "ndjson": "ndjson", "csv": "csv", "parquet": "parquet"}
+
+# Сколько строк отчета переводится в значения для записи за один раз
+REPORT_CHUNK_SIZE = 10000
+
+
+class ReportHandle:
+    """Легкая ссылка на записанный отчет вместо его содержимого"""
+
+    def __init__(self, path: str, output_format: str, rows: int):
+        self.path = path
+        self.output_format = output_format
+        self.rows = rows
+
+    def __repr__(self) -> str:
+        return f"ReportHandle(path={self.path!r}, output_format={self.output_format!r}, rows={self.rows})"
+
+    def read_text(self) -> str:
+        """Возвращает содержимое текстового отчета"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def to_frame(self) -> pd.DataFrame:
+        """Считывает отчет обратно в DataFrame"""
+        if self.output_format == "parquet":
+            return pd.read_parquet(self.path)
+        if self.output_format == "csv":
+            return pd.read_csv(self.path)
+        return pd.read_json(self.path, lines=self.output_format == "ndjson", dtype=False)
+
+
+def _plain_records(df: pd.DataFrame) -> Iterator[dict]:
+    """Отдает строки отчета по одной, переводя в значения для JSON только очередную часть строк"""
+    for start in range(0, len(df), REPORT_CHUNK_SIZE):
+        chunk = to_plain_frame(df.iloc[start : start + REPORT_CHUNK_SIZE], "%Y-%m-%d")
+        yield from chunk.to_dict(orient="records")
+
+
+def write_report(df: pd.DataFrame, path: str, output_format: str = "json") -> int:
+    """Записывает отчет в файл построчно, не собирая весь результат в памяти; возвращает число строк"""
+    if output_format not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчета: {output_format}")
+
+    if output_format == "parquet":
+        # Parquet требует pyarrow или fastparquet, типы колонок сохраняются как есть
+        df.to_parquet(path, index=False)
+        return len(df)
+
+    with open(path, "w", encoding="utf-8", newline="" if output_format == "csv" else None) as f:
+        if output_format == "csv":
+            for start in range(0, len(df), REPORT_CHUNK_SIZE):
+                chunk = to_plain_frame(df.iloc[start : start + REPORT_CHUNK_SIZE], "%Y-%m-%d")
+                chunk.to_csv(f, header=start == 0, index=False)
+            if df.empty:
+                df.to_csv(f, index=False)
+        elif output_format == "ndjson":
+            for record in _plain_records(df):
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+        elif output_format == "json_compact":
+            f.write("[")
+            for number, record in enumerate(_plain_records(df)):
+                f.write("," if number else "")
+                f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            f.write("]")
+        else:
+            # Побайтно совпадает с json.dumps(records, ensure_ascii=False, indent=4)
+            if df.empty:
+                f.write("[]")
+            else:
+                f.write("[\n")
+                for number, record in enumerate(_plain_records(df)):
+                    f.write(",\n" if number else "")
+                    f.write(textwrap.indent(json.dumps(record, ensure_ascii=False, indent=4), "    "))
+                f.write("\n]")
+    return len(df)
+
+
+# Фоновая запись отчетов; один поток сохраняет порядок записи
+_report_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report_writer")
+
+
+def _log_report_write(path: str, future: Future) -> None:
+    """Логирует результат фоновой записи отчета"""
+    if future.exception():
+        logging.error(f"Ошибка при фоновой записи отчета {path}: {future.exception()}")
+    else:
+        logging.info(f"Отчет сохранен в файл {path}")
+
+
+def write_report_in_background(df: pd.DataFrame, path: str, output_format: str = "json") -> Future:
+    """Записывает отчет в файл в фоновом потоке, не задерживая вызывающий код"""
+    future = _report_writer.submit(write_report, df, path, output_format)
+    future.add_done_callback(partial(_log_report_write, path))
+    return future
+
+
+def wait_for_report_writes() -> None:
+    """Дожидается окончания всех запущенных фоновых записей отчетов"""
+    _report_writer.submit(lambda: None).result()
+
+
+def report_to_file(
+    file_name: Optional[str] = None, output_format: str = "json", return_handle: bool = False
+) -> Callable[[Callable[..., pd.DataFrame]], Callable[..., Union[str, ReportHandle]]]:
     """Декоратор для записи результата функции в файл"""
+    if output_format not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчета: {output_format}")
 
-    def decorator(func):
+    def decorator(func: Callable[..., pd.DataFrame]) -> Callable[..., Union[str, ReportHandle]]:
         @wraps(func)
-        def wrapper(*args, **kwargs):
+        def wrapper(*args: Any, **kwargs: Any) -> Union[str, ReportHandle]:
             logging.info(f"Вызов функции {func.__name__} с аргументами: {args}, {kwargs}")
             try:
                 # Выполнение функции и получение результата
                 result_df = func(*args, **kwargs)
 
-                # Преобразование всех столбцов типа datetime в строки
-                if not result_df.empty:
-                    for col in result_df.select_dtypes(include=["datetime64[ns]"]).columns:
-                        result_df[col] = result_df[col].dt.strftime("%Y-%m-%d")
-
-                # Преобразование результата в JSON
-                result_json = result_df.to_dict(orient="records")
-                result_json_str = json.dumps(result_json, ensure_ascii=False, indent=4)
-
                 # Определение имени файла
                 output_file_name = (
                     file_name
                     if file_name
-                    else f"report_{func.__name__}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+                    else f"report_{func.__name__}_{datetime.now().strftime('%Y%m%d_%H%M%S')}."
+                    f"{REPORT_FORMATS[output_format]}"
                 )
 
-                # Запись JSON в файл
-                with open(output_file_name, "w", encoding="utf-8") as f:
-                    f.write(result_json_str)
+                # Строки пишутся в файл по мере преобразования, без промежуточного списка и общей строки
+                rows = write_report(result_df, output_file_name, output_format)
                 logging.info(f"Отчет сохранен в файл {output_file_name}")
 
-                return result_json_str  # Возвращаем JSON
+                handle = ReportHandle(output_file_name, output_format, rows)
+                if return_handle or output_format == "parquet":
+                    return handle
+                return handle.read_text()  # Возвращаем JSON
             except Exception as e:
                 logging.error(f"Ошибка в функции {func.__name__}: {e}")
                 raise
@@ -52,47 +159,88 @@ def report_to_file(file_name: Optional[str] = None):
     return decorator
 
 
-@report_to_file()
-def spending_by_category(transactions: pd.DataFrame, category: str, date: Optional[str] = None) -> pd.DataFrame:
-    """Возвращает траты по категории за последние три месяца с заданной даты (или от текущей даты)"""
-    logging.info(f"Функция spending_by_category вызвана с категорией: {category} и датой: {date}")
-
+def _parse_report_date(date: Optional[str] = None) -> Optional[datetime]:
+    """Преобразует дату отчета в datetime, при неверном формате возвращает None"""
     if date is None:
         date = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
 
     # Попробуйте преобразовать строку даты в datetime объект
     try:
         # Попытайтесь преобразовать входную дату в формат YYYY.MM.DD HH:MM:SS
-        end_date = datetime.strptime(date, "%Y.%m.%d %H:%M:%S")
+        return datetime.strptime(date, "%Y.%m.%d %H:%M:%S")
     except ValueError:
         try:
             # Попытайтесь преобразовать входную дату в формат YYYY-MM-DD HH:MM:SS
-            end_date = datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
-            # Преобразуйте в нужный формат
-            end_date = end_date.strftime("%Y.%m.%d %H:%M:%S")
-            end_date = datetime.strptime(end_date, "%Y.%m.%d %H:%M:%S")
+            return datetime.strptime(date, "%Y-%m-%d %H:%M:%S")
         except ValueError:
             logging.error("Неверный формат даты. Используйте 'YYYY.MM.DD HH:MM:SS'.")
-            return pd.DataFrame()  # Возвращаем пустой DataFrame вместо ошибки
+            return None
+
+
+def _matching_categories(names: pd.Index, category: str) -> list[str]:
+    """Возвращает названия категорий, которые содержат искомую подстроку"""
+    names = pd.Index(names).astype(str)
+    return list(names[names.str.contains(category, case=False, regex=True)])
 
-    # Установка даты начала и конца диапазона
-    start_date = end_date - timedelta(days=90)
 
-    # Преобразование формата даты в DataFrame
-    transactions["Дата операции"] = pd.to_datetime(transactions["Дата операции"], format="%d.%m.%Y", errors="coerce")
+def _category_mask(categories: pd.Series, category: str) -> pd.Series:
+    """Отмечает строки, категория которых содержит искомую подстроку"""
+    if isinstance(categories.dtype, pd.CategoricalDtype):
+        # Сравниваем только уникальные названия категорий, а не каждую строку
+        return categories.isin(_matching_categories(categories.cat.categories, category))
+    return categories.str.contains(category, case=False, na=False)
 
-    # Убедитесь, что данные не содержат NaT после преобразования
-    if transactions["Дата операции"].isnull().any():
-        logging.warning("Некоторые даты не были преобразованы. Проверьте данные.")
-        transactions = transactions.dropna(subset=["Дата операции"])
+
+def _filter_spending(
+    transactions: Union[pd.DataFrame, TransactionFrame, TransactionStore],
+    category: str,
+    start_date: datetime,
+    end_date: datetime,
+) -> pd.DataFrame:
+    """Отбирает транзакции категории, попадающие в диапазон дат"""
+    if isinstance(transactions, TransactionStore):
+        # Фильтры по дате и категории выполняются в хранилище по индексам
+        categories = _matching_categories(pd.Index(transactions.categories()), category)
+        return transactions.query(start_date, end_date, categories=categories).data.copy()
+
+    if isinstance(transactions, TransactionFrame):
+        # Даты уже разобраны при загрузке, окно выбирается по отсортированному индексу дат
+        window = transactions.between(start_date, end_date)
+        return window[_category_mask(window["Категория"], category)].copy()
+    else:
+        # Преобразование формата даты в DataFrame
+        transactions["Дата операции"] = pd.to_datetime(
+            transactions["Дата операции"], format="%d.%m.%Y", errors="coerce"
+        )
+
+        # Убедитесь, что данные не содержат NaT после преобразования
+        if transactions["Дата операции"].isnull().any():
+            logging.warning("Некоторые даты не были преобразованы. Проверьте данные.")
+            transactions = transactions.dropna(subset=["Дата операции"])
 
     # Фильтрация данных по категории и дате
-    filtered_df = transactions[
-        (transactions["Категория"].str.contains(category, case=False, na=False))
+    return transactions[
+        _category_mask(transactions["Категория"], category)
         & (transactions["Дата операции"] >= start_date)
         & (transactions["Дата операции"] <= end_date)
     ].copy()
 
+
+def build_spending_by_category(
+    transactions: Union[pd.DataFrame, TransactionFrame, TransactionStore], category: str, date: Optional[str] = None
+) -> pd.DataFrame:
+    """Строит отчет о тратах по категории за последние три месяца с заданной даты без записи в файл"""
+    logging.info(f"Функция spending_by_category вызвана с категорией: {category} и датой: {date}")
+
+    end_date = _parse_report_date(date)
+    if end_date is None:
+        return pd.DataFrame()  # Возвращаем пустой DataFrame вместо ошибки
+
+    # Установка даты начала и конца диапазона
+    start_date = end_date - timedelta(days=90)
+
+    filtered_df = _filter_spending(transactions, category, start_date, end_date)
+
     # Преобразование формата даты в строку
     filtered_df["Дата операции"] = filtered_df["Дата операции"].dt.strftime("%Y.%m.%d %H:%M:%S")
 
@@ -101,6 +249,192 @@ def spending_by_category(transactions: pd.DataFrame, category: str, date: Option
     return filtered_df
 
 
+@report_to_file()
+def spending_by_category(
+    transactions: Union[pd.DataFrame, TransactionFrame, TransactionStore], category: str, date: Optional[str] = None
+) -> pd.DataFrame:
+    """Возвращает траты по категории за последние три месяца с заданной даты (или от текущей даты)"""
+    return build_spending_by_category(transactions, category, date)
+
+
+@report_to_file()
+def spending_by_category_chunks(
+    chunks: Iterable[pd.DataFrame], category: str, date: Optional[str] = None
+) -> pd.DataFrame:
+    """Возвращает траты по категории за три месяца, обрабатывая транзакции частями"""
+    logging.info(f"Функция spending_by_category_chunks вызвана с категорией: {category} и датой: {date}")
+
+    end_date = _parse_report_date(date)
+    if end_date is None:
+        return pd.DataFrame()
+
+    start_date = end_date - timedelta(days=90)
+
+    # В памяти остаются только подходящие строки каждой части; даты части разбираются во всех форматах выгрузки
+    parts = [
+        _filter_spending(TransactionFrame.from_raw(chunk), category, start_date, end_date)
+        for chunk in chunks
+        if not chunk.empty
+    ]
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        logging.info(f"Найдено 0 транзакций по категории {category}.")
+        return pd.DataFrame()
+
+    filtered_df = pd.concat(parts, ignore_index=True)
+    filtered_df["Дата операции"] = filtered_df["Дата операции"].dt.strftime("%Y.%m.%d %H:%M:%S")
+
+    logging.info(f"Найдено {len(filtered_df)} транзакций по категории {category}.")
+
+    return filtered_df
+
+
+@report_to_file()
+def spending_by_categories(
+    transactions: Union[pd.DataFrame, TransactionFrame, TransactionStore],
+    categories: list[str],
+    date: Optional[str] = None,
+    windows: Optional[list[int]] = None,
+) -> pd.DataFrame:
+    """Возвращает траты по нескольким категориям и окнам (в днях до даты) одним отчетом за один проход"""
+    logging.info(
+        f"Функция spending_by_categories вызвана с категориями: {categories}, окнами: {windows}, датой: {date}"
+    )
+
+    end_date = _parse_report_date(date)
+    if end_date is None or not categories:
+        return pd.DataFrame()
+
+    windows = sorted(set(windows or [90]))
+    start_date = end_date - timedelta(days=windows[-1])
+
+    # Даты разбираются один раз, дальше все окна выбираются из строк самого широкого окна
+    if isinstance(transactions, TransactionStore):
+        names = pd.Index(transactions.categories())
+        matched = sorted({name for category in categories for name in _matching_categories(names, category)})
+        window_df = transactions.query(start_date, end_date, categories=matched).data
+    else:
+        window_df = as_transaction_frame(transactions).dropna_dates().between(start_date, end_date)
+
+    if window_df.empty:
+        logging.info(f"Найдено 0 транзакций по категориям {categories}.")
+        return pd.DataFrame()
+
+    # Матрица «запрос × категория» строится по словарю категорий, строки сопоставляются с ней по кодам
+    row_categories = window_df["Категория"]
+    if not isinstance(row_categories.dtype, pd.CategoricalDtype):
+        row_categories = row_categories.astype("category")
+    vocabulary = row_categories.cat.categories
+    matrix = np.zeros((len(categories), len(vocabulary) + 1), dtype=bool)
+    for query_id, category in enumerate(categories):
+        matrix[query_id, :-1] = vocabulary.isin(_matching_categories(vocabulary, category))
+    # Код -1 (категория не указана) попадает в последний столбец, который всегда False
+    codes = row_categories.cat.codes.to_numpy()
+    dates = window_df["Дата операции"].to_numpy(dtype="datetime64[ns]")
+
+    parts = []
+    for window in windows:
+        in_window = dates >= np.datetime64(end_date - timedelta(days=window), "ns")
+        for query_id, category in enumerate(categories):
+            positions = np.flatnonzero(matrix[query_id, codes] & in_window)
+            if len(positions):
+                labels: dict[str, Any] = {"Запрос категории": category, "Окно, дней": window}
+                parts.append(window_df.iloc[positions].assign(**labels))
+
+    if not parts:
+        logging.info(f"Найдено 0 транзакций по категориям {categories}.")
+        return pd.DataFrame()
+
+    result = pd.concat(parts, ignore_index=True)
+    result["Дата операции"] = result["Дата операции"].dt.strftime("%Y.%m.%d %H:%M:%S")
+
+    logging.info(f"Найдено {len(result)} строк отчета по {len(categories)} категориям и {len(windows)} окнам.")
+
+    return result
+
+
+@report_to_file()
+def spending_trend(
+    transactions: Union[pd.DataFrame, TransactionFrame, TransactionStore],
+    categories: Optional[list[str]] = None,
+    date: Optional[str] = None,
+    window: int = 90,
+    months: Optional[int] = None,
+) -> pd.DataFrame:
+    """Возвращает траты за скользящее окно на каждую дату по категориям, окно считается по префиксным суммам"""
+    logging.info(f"Функция spending_trend вызвана с категориями: {categories}, окном: {window}, месяцами: {months}")
+
+    if window < 1:
+        raise ValueError(f"Окно тренда должно быть не меньше одного дня: {window}")
+    if months is not None and months < 1:
+        raise ValueError(f"Окно тренда должно быть не меньше одного месяца: {months}")
+
+    end_date = _parse_report_date(date) if date else None
+    if date and end_date is None:
+        return pd.DataFrame()
+
+    if isinstance(transactions, TransactionStore):
+        data = transactions.query(end=end_date).data
+    else:
+        data = as_transaction_frame(transactions).dropna_dates().data
+        if end_date is not None:
+            data = data[data["Дата операции"] <= end_date]
+    if data.empty:
+        return pd.DataFrame()
+
+    # Дневная сетка от первой операции до конца периода: суммы трат по (категория, день) за один проход
+    days = data["Дата операции"].dt.normalize()
+    first_day = days.min()
+    last_day = pd.Timestamp(end_date).normalize() if end_date is not None else days.max()
+    day_count = (last_day - first_day).days + 1
+    day_numbers = ((days - first_day).dt.days).to_numpy()
+
+    row_categories = data["Категория"]
+    if not isinstance(row_categories.dtype, pd.CategoricalDtype):
+        row_categories = row_categories.astype("category")
+    vocabulary = row_categories.cat.categories
+    codes = row_categories.cat.codes.to_numpy().astype("int64")
+    amounts = data["Сумма операции"].to_numpy(dtype="float64")
+    spent = np.where(amounts < 0, -amounts, 0.0)
+
+    valid = codes >= 0
+    grid = np.bincount(
+        codes[valid] * day_count + day_numbers[valid], weights=spent[valid], minlength=len(vocabulary) * day_count
+    ).reshape(len(vocabulary), day_count)
+
+    # Запросы категорий сводятся к матрице «запрос × категория», траты запроса - сумма его категорий
+    if categories:
+        matrix = np.array([vocabulary.isin(_matching_categories(vocabulary, category)) for category in categories])
+        grid = matrix.astype("float64") @ grid
+        names = list(categories)
+    else:
+        names = list(vocabulary.astype(str))
+
+    # Сумма за окно - разность двух префиксных сумм, для каждой даты за O(1)
+    prefix = np.concatenate([np.zeros((len(names), 1)), np.cumsum(grid, axis=1)], axis=1)
+    dates = pd.date_range(first_day, last_day, freq="D")
+    day_index = np.arange(day_count)
+    if months is not None:
+        # Окно выровнено по календарным месяцам: с первого числа месяца, отстоящего на months - 1 назад
+        month_starts = (dates.to_period("M") - (months - 1)).to_timestamp()
+        window_starts = np.maximum((month_starts - first_day).days.to_numpy(), 0)
+    else:
+        window_starts = np.maximum(day_index - window + 1, 0)
+    totals = prefix[:, day_index + 1] - prefix[:, window_starts]
+
+    result = pd.DataFrame(
+        {
+            "Дата": np.tile(dates, len(names)),
+            "Категория": np.repeat(names, day_count),
+            "Траты за окно": np.round(totals.ravel(), 2),
+        }
+    )
+
+    logging.info(f"Построен тренд трат: {len(names)} категорий, {day_count} дней.")
+
+    return result
+
+
 if __name__ == "__main__":
     data = {
         "Дата операции": ["01.07.2024", "10.07.2024", "15.07.2024", "20.04.2024"],
@@ -0,0 +1,190 @@
+import logging
+import re
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+logger.addHandler(stream_handler)
+
+# Колонки, по которым ищет search_transactions
+SEARCH_COLUMNS = ("Описание", "Категория")
+
+# Метасимволы регулярных выражений
+_REGEX_CHARS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+def is_regex_query(query: str) -> bool:
+    """Проверяет, содержит ли запрос метасимволы и трактуется ли он как регулярное выражение, как в str.contains"""
+    return bool(_REGEX_CHARS.search(query))
+
+
+def fold_text(values: pd.Series) -> pd.Series:
+    """Приводит значения колонки к нижнему регистру, нестроковые значения становятся NaN"""
+    return values.astype(object).str.lower()
+
+
+def _trigrams(text: str) -> set[str]:
+    """Возвращает множество триграмм строки"""
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Инвертированный индекс по словам и триграммам для поиска подстроки без обхода всех строк"""
+
+    def __init__(self, df: pd.DataFrame, columns: Iterable[str] = SEARCH_COLUMNS):
+        columns = [column for column in columns if column in df.columns]
+        rows_count = len(df)
+        self.rows_count = rows_count
+
+        # Все тексты колонок сводятся к словарю уникальных значений со списком строк для каждого
+        texts = pd.concat([fold_text(df[column]) for column in columns], ignore_index=True)
+        rows = np.tile(np.arange(rows_count), len(columns))
+        valid = texts.notna().to_numpy()
+        codes, values = pd.factorize(texts[valid])
+        rows = rows[valid]
+
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=len(values)))[:-1]
+        self.values: list[str] = list(values)
+        self.value_rows: list[np.ndarray] = np.split(rows[order], bounds) if len(values) else []
+
+        # Слова значений и триграммы слов
+        token_ids: dict[str, int] = {}
+        self.token_values: list[list[int]] = []
+        for value_id, value in enumerate(self.values):
+            for token in set(value.split()):
+                if token not in token_ids:
+                    token_ids[token] = len(token_ids)
+                    self.token_values.append([])
+                self.token_values[token_ids[token]].append(value_id)
+        self.tokens: list[str] = list(token_ids)
+
+        self.trigram_tokens: dict[str, set[int]] = {}
+        for token_id, token in enumerate(self.tokens):
+            for trigram in _trigrams(token):
+                self.trigram_tokens.setdefault(trigram, set()).add(token_id)
+
+        logger.debug(
+            f"Индекс поиска построен: {len(self.values)} значений, {len(self.tokens)} слов, "
+            f"{len(self.trigram_tokens)} триграмм"
+        )
+
+    def _tokens_containing(self, piece: str) -> Iterable[int]:
+        """Возвращает слова, содержащие подстроку"""
+        trigrams = _trigrams(piece)
+        if not trigrams:
+            # Для коротких подстрок перебирается словарь слов, а не строки данных
+            return [token_id for token_id, token in enumerate(self.tokens) if piece in token]
+
+        postings = sorted((self.trigram_tokens.get(trigram, set()) for trigram in trigrams), key=len)
+        candidates = set.intersection(*postings)
+        return [token_id for token_id in candidates if piece in self.tokens[token_id]]
+
+    def matching_values(self, query: str) -> list[int]:
+        """Возвращает номера значений словаря, содержащих запрос"""
+        query = query.lower()
+        if is_regex_query(query):
+            # Запрос с метасимволами трактуется как регулярное выражение, как в str.contains
+            pattern = re.compile(query)
+            return [value_id for value_id, value in enumerate(self.values) if pattern.search(value)]
+
+        pieces = query.split()
+        if not pieces:
+            # Пустой запрос или только пробелы проверяются по всему словарю значений
+            return [value_id for value_id, value in enumerate(self.values) if query in value]
+
+        # Самая длинная часть запроса без пробелов целиком лежит внутри одного слова
+        longest = max(pieces, key=len)
+        candidates = {
+            value_id for token_id in self._tokens_containing(longest) for value_id in self.token_values[token_id]
+        }
+        return sorted(value_id for value_id in candidates if query in self.values[value_id])
+
+    def rows_for_values(self, value_ids: Iterable[int]) -> np.ndarray:
+        """Возвращает отсортированные позиции строк, в которых встречаются значения словаря"""
+        matched = [self.value_rows[value_id] for value_id in value_ids]
+        if not matched:
+            return np.array([], dtype=np.int64)
+
+        total = sum(len(rows) for rows in matched)
+        if total * 16 < self.rows_count:
+            return np.unique(np.concatenate(matched))
+
+        # Для больших результатов отметка в маске дешевле сортировки
+        mask = np.zeros(self.rows_count, dtype=bool)
+        for rows in matched:
+            mask[rows] = True
+        return np.flatnonzero(mask)
+
+    def search(self, query: str) -> np.ndarray:
+        """Возвращает позиции строк, у которых описание или категория содержит запрос без учета регистра"""
+        return self.rows_for_values(self.matching_values(query))
+
+    def search_many(self, queries: list[str]) -> list[np.ndarray]:
+        """Ищет все запросы за один проход автомата по словарю значений, запросы с метасимволами - как в search"""
+        query_values: list[list[int]] = [[] for _ in queries]
+        # Запросы с метасимволами трактуются как регулярные выражения и не попадают в автомат
+        literal_ids = []
+        for query_id, query in enumerate(queries):
+            if is_regex_query(query):
+                query_values[query_id] = self.matching_values(query)
+            else:
+                literal_ids.append(query_id)
+
+        automaton = AhoCorasick([queries[query_id].lower() for query_id in literal_ids])
+        for value_id, value in enumerate(self.values):
+            for pattern_id in automaton.find(value):
+                query_values[literal_ids[pattern_id]].append(value_id)
+        return [self.rows_for_values(value_ids) for value_ids in query_values]
+
+
+class AhoCorasick:
+    """Автомат Ахо-Корасик для поиска многих подстрок за один проход по тексту"""
+
+    def __init__(self, patterns: list[str]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[set[int]] = [set()]
+
+        # Бор из всех шаблонов
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].add(pattern_id)
+
+        # Суффиксные ссылки обходом в ширину
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text: str) -> set[int]:
+        """Возвращает номера шаблонов, которые встречаются в тексте"""
+        # Пустой шаблон содержится в любой строке
+        found = set(self.output[0])
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            if self.output[node]:
+                found |= self.output[node]
+        return found
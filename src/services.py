@@ -1,8 +1,13 @@
 import json
 import logging
+from typing import Union
 
 import pandas as pd
 
+from src.search_index import SEARCH_COLUMNS, SearchIndex
+from src.storage import TransactionStore
+from src.transactions import TransactionFrame, to_plain_frame
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
@@ -11,12 +16,20 @@ stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 
 
-def search_transactions(transactions: list[dict], search_query: str) -> str:
+def search_transactions(
+    transactions: Union[list[dict], pd.DataFrame, TransactionFrame, TransactionStore], search_query: str
+) -> str:
     """Ищет транзакции по строке запроса в описании или категории и возвращает результат в формате JSON"""
     logger.info(f"Начинаем поиск транзакций по запросу '{search_query}'")
     try:
-        df = pd.DataFrame(transactions)
-        logger.debug("Данные успешно преобразованы в DataFrame")
+        if isinstance(transactions, TransactionStore):
+            # Поиск выполняется в хранилище, загружаются только найденные строки
+            df = transactions.query(search=search_query).data
+        elif isinstance(transactions, TransactionFrame):
+            df = transactions.data
+        else:
+            df = pd.DataFrame(transactions)
+            logger.debug("Данные успешно преобразованы в DataFrame")
 
         # Проверка наличия необходимых колонок
         required_columns = {"Описание", "Категория"}
@@ -26,14 +39,21 @@ def search_transactions(transactions: list[dict], search_query: str) -> str:
             raise ValueError(error_message)
 
         # Поиск по описанию и категории
-        search_query_lower = search_query.lower()
-        filtered_df = df[
-            df["Описание"].str.lower().str.contains(search_query_lower, na=False)
-            | df["Категория"].str.lower().str.contains(search_query_lower, na=False)
-        ]
+        if isinstance(transactions, TransactionStore):
+            filtered_df = df
+        elif isinstance(transactions, TransactionFrame):
+            # Для нормализованных данных используется индекс, построенный один раз на набор данных
+            filtered_df = df.iloc[transactions.search_index.search(search_query)]
+        else:
+            search_query_lower = search_query.lower()
+            filtered_df = df[
+                df["Описание"].str.lower().str.contains(search_query_lower, na=False)
+                | df["Категория"].str.lower().str.contains(search_query_lower, na=False)
+            ]
 
         # Приведение данных к строковому типу и замена NaN
-        filtered_df = filtered_df.fillna("")
+        filtered_df = to_plain_frame(filtered_df)
+        filtered_df = filtered_df.where(filtered_df.notna(), "")
         for column in ["Кэшбэк", "MCC"]:
             if column in filtered_df.columns:
                 filtered_df[column] = filtered_df[column].astype(str)
@@ -50,6 +70,41 @@ def search_transactions(transactions: list[dict], search_query: str) -> str:
         return json.dumps({"error": str(e)}, ensure_ascii=False, indent=4)
 
 
+def search_transactions_batch(
+    transactions: Union[list[dict], pd.DataFrame, TransactionFrame, TransactionStore],
+    queries: list[str],
+    counts_only: bool = False,
+) -> str:
+    """Ищет сразу несколько запросов за один проход и возвращает номера строк или количество для каждого"""
+    logger.info(f"Начинаем пакетный поиск по {len(queries)} запросам")
+    try:
+        if isinstance(transactions, TransactionStore):
+            transactions = transactions.to_frame()
+
+        if isinstance(transactions, TransactionFrame):
+            df = transactions.data
+            index = transactions.search_index
+        else:
+            df = pd.DataFrame(transactions)
+            if not set(SEARCH_COLUMNS).issubset(df.columns):
+                raise ValueError("Отсутствуют необходимые колонки в данных")
+            index = SearchIndex(df)
+
+        # Все запросы ищутся одним автоматом по словарю описаний и категорий
+        rows_by_query = index.search_many(queries)
+
+        result: dict = {}
+        for query, rows in zip(queries, rows_by_query):
+            result[query] = len(rows) if counts_only else {"count": len(rows), "rows": df.index[rows].tolist()}
+
+        logger.info("Пакетный поиск завершен.")
+        return json.dumps(result, ensure_ascii=False, indent=4)
+
+    except Exception as e:
+        logger.error(f"Ошибка при пакетном поиске транзакций: {str(e)}")
+        return json.dumps({"error": str(e)}, ensure_ascii=False, indent=4)
+
+
 if __name__ == "__main__":
     transactions = [
         {"Описание": "Купил кофе", "Категория": "Кафе", "Кэшбэк": 10, "MCC": 5812},
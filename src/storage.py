@@ -0,0 +1,378 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.offsets import Day, MonthBegin, MonthEnd
+
+from src.currency import ORIGINAL_AMOUNT_COLUMN, convert_to_rub
+from src.search_index import is_regex_query
+from src.transactions import DATE_COLUMN, TransactionFrame, as_transaction_frame, load_transactions
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+logger.addHandler(stream_handler)
+
+DEFAULT_STORE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "transactions.db")
+
+# Соответствие колонок выгрузки колонкам таблицы и их типы
+STORE_COLUMNS = {
+    "Дата операции": "op_date",
+    "Дата платежа": "pay_date",
+    "Номер карты": "card",
+    "Статус": "status",
+    "Сумма операции": "amount",
+    "Валюта операции": "currency",
+    "Сумма платежа": "pay_amount",
+    "Валюта платежа": "pay_currency",
+    "Кэшбэк": "cashback",
+    "Категория": "category",
+    "MCC": "mcc",
+    "Описание": "description",
+    "Бонусы (включая кэшбэк)": "bonuses",
+    "Округление на инвесткопилку": "rounding",
+    "Сумма операции с округлением": "rounded_amount",
+    ORIGINAL_AMOUNT_COLUMN: "original_amount",
+}
+COLUMN_TYPES = {
+    "amount": "REAL",
+    "pay_amount": "REAL",
+    "cashback": "REAL",
+    "mcc": "INTEGER",
+    "bonuses": "REAL",
+    "rounding": "REAL",
+    "rounded_amount": "REAL",
+    "original_amount": "REAL",
+}
+
+# Поля, из которых складывается ключ транзакции
+KEY_COLUMNS = ["Дата операции", "Номер карты", "Сумма операции", "Валюта операции", "MCC", "Описание", "Статус"]
+
+STORE_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS transactions (
+    tx_key TEXT PRIMARY KEY,
+    {", ".join(f"{column} {COLUMN_TYPES.get(column, 'TEXT')}" for column in STORE_COLUMNS.values())},
+    description_folded TEXT,
+    category_folded TEXT
+);
+CREATE TABLE IF NOT EXISTS store_columns (name TEXT PRIMARY KEY);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions (op_date);
+CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions (category, op_date);
+CREATE INDEX IF NOT EXISTS idx_transactions_card ON transactions (card, op_date);
+"""
+
+# Агрегаты по дням и месяцам; пропуски в ключе хранятся как '' и -1, чтобы строки с ними объединялись
+_ROLLUPS = {"daily_rollup": ("day", 10), "monthly_rollup": ("month", 7)}
+_ROLLUP_VALUES = """
+    COALESCE({row}.card, ''), COALESCE({row}.category, ''), COALESCE({row}.mcc, -1),
+    {agg}(CASE WHEN {row}.amount < 0 THEN -{row}.amount ELSE 0 END),
+    {agg}(CASE WHEN {row}.amount > 0 THEN {row}.amount ELSE 0 END),
+    {agg}(COALESCE({row}.cashback, 0)),
+    {count}
+"""
+_ROLLUP_SCHEMA = "".join(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    {period} TEXT NOT NULL,
+    card TEXT NOT NULL,
+    category TEXT NOT NULL,
+    mcc INTEGER NOT NULL,
+    spent REAL NOT NULL,
+    income REAL NOT NULL,
+    cashback REAL NOT NULL,
+    operations INTEGER NOT NULL,
+    PRIMARY KEY ({period}, card, category, mcc)
+);
+CREATE TRIGGER IF NOT EXISTS trg_{table} AFTER INSERT ON transactions WHEN NEW.op_date IS NOT NULL
+BEGIN
+    INSERT INTO {table}
+    VALUES (substr(NEW.op_date, 1, {length}), {_ROLLUP_VALUES.format(row="NEW", agg="", count="1")})
+    ON CONFLICT ({period}, card, category, mcc) DO UPDATE SET
+        spent = spent + excluded.spent,
+        income = income + excluded.income,
+        cashback = cashback + excluded.cashback,
+        operations = operations + excluded.operations;
+END;
+""" for table, (period, length) in _ROLLUPS.items())
+
+
+def _rollup_parts(
+    start: Optional[datetime], end: Optional[datetime]
+) -> list[tuple[str, str, Optional[str], Optional[str]]]:
+    """Делит период на целые месяцы из месячных агрегатов и неполные края из дневных"""
+    start_day = pd.Timestamp(start).normalize() if start is not None else None
+    end_day = pd.Timestamp(end).normalize() if end is not None else None
+
+    first_month = None if start_day is None else start_day if start_day.day == 1 else start_day + MonthBegin(1)
+    last_month_end = None if end_day is None else end_day if end_day.is_month_end else end_day - MonthEnd(1)
+    if (
+        start_day is not None
+        and end_day is not None
+        and first_month is not None
+        and last_month_end is not None
+        and first_month > last_month_end
+    ):
+        # В периоде нет ни одного целого месяца
+        return [("daily_rollup", "day", start_day.strftime("%Y-%m-%d"), end_day.strftime("%Y-%m-%d"))]
+
+    parts = [
+        (
+            "monthly_rollup",
+            "month",
+            first_month.strftime("%Y-%m") if first_month is not None else None,
+            last_month_end.strftime("%Y-%m") if last_month_end is not None else None,
+        )
+    ]
+    if start_day is not None and first_month is not None and start_day < first_month:
+        parts.append(
+            ("daily_rollup", "day", start_day.strftime("%Y-%m-%d"), (first_month - Day(1)).strftime("%Y-%m-%d"))
+        )
+    if end_day is not None and last_month_end is not None and last_month_end < end_day:
+        parts.append(
+            ("daily_rollup", "day", (last_month_end + Day(1)).strftime("%Y-%m-%d"), end_day.strftime("%Y-%m-%d"))
+        )
+    return parts
+
+
+def transaction_keys(data: pd.DataFrame) -> pd.Series:
+    """Строит стабильные ключи транзакций для удаления дублей при повторной загрузке"""
+    columns = [column for column in KEY_COLUMNS if column in data.columns and column != DATE_COLUMN]
+    parts = data[columns].astype(object).where(data[columns].notna(), "").astype(str)
+    dates = data[DATE_COLUMN].dt.strftime(STORE_DATE_FORMAT).fillna("")
+    base = dates.str.cat([parts[column] for column in columns], sep="|")
+
+    # Одинаковые операции в одной выписке различаются порядковым номером
+    occurrence = base.groupby(base).cumcount().astype(str)
+    keys: pd.Series = (base + "#" + occurrence).map(lambda text: hashlib.sha1(text.encode("utf-8")).hexdigest())
+    return keys
+
+
+def _regexp(pattern: str, value: Optional[str]) -> bool:
+    """Реализация оператора REGEXP для SQLite"""
+    return value is not None and re.search(pattern, value) is not None
+
+
+class TransactionStore:
+    """Локальное хранилище транзакций в SQLite с дозагрузкой новых выписок"""
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(_SCHEMA + _ROLLUP_SCHEMA)
+        self._add_missing_columns()
+        # Оператор REGEXP для запросов поиска с метасимволами
+        self.connection.create_function("regexp", 2, _regexp, deterministic=True)
+
+        # Хранилище, созданное до появления агрегатов, заполняется один раз целиком
+        if len(self) and not self.connection.execute("SELECT 1 FROM monthly_rollup LIMIT 1").fetchone():
+            self.rebuild_rollups()
+
+    def _add_missing_columns(self) -> None:
+        """Добавляет в таблицу хранилища, созданного раньше, колонки, появившиеся позже"""
+        existing = {row[1] for row in self.connection.execute("PRAGMA table_info(transactions)")}
+        with self.connection:
+            for column in STORE_COLUMNS.values():
+                if column not in existing:
+                    self.connection.execute(
+                        f"ALTER TABLE transactions ADD COLUMN {column} {COLUMN_TYPES.get(column, 'TEXT')}"
+                    )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> "TransactionStore":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        count: int = self.connection.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+        return count
+
+    def append(self, transactions: Union[pd.DataFrame, TransactionFrame], convert_currency: bool = True) -> int:
+        """Добавляет транзакции, уже загруженные ранее пропускаются; возвращает число новых строк"""
+        frame = as_transaction_frame(transactions)
+        data = frame.data
+        if data.empty:
+            return 0
+
+        # Ключ строится по исходной сумме, чтобы повторная загрузка не зависела от доступности курсов
+        keys = transaction_keys(data)
+        if convert_currency:
+            # В хранилище и агрегатах суммы лежат в рублях, исходная сумма сохраняется в отдельной колонке
+            data = convert_to_rub(frame).data
+
+        rows = pd.DataFrame({"tx_key": keys}, index=data.index)
+        for source, column in STORE_COLUMNS.items():
+            rows[column] = data[source] if source in data.columns else None
+        rows["op_date"] = data[DATE_COLUMN].dt.strftime(STORE_DATE_FORMAT)
+        rows["description_folded"] = rows["description"].astype(object).str.lower()
+        rows["category_folded"] = rows["category"].astype(object).str.lower()
+        rows = rows.astype(object).where(rows.notna(), None)
+
+        columns = list(rows.columns)
+        with self.connection:
+            # Агрегаты обновляются триггерами только для действительно добавленных строк
+            cursor = self.connection.executemany(
+                f"INSERT OR IGNORE INTO transactions ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                rows.itertuples(index=False, name=None),
+            )
+            inserted = cursor.rowcount
+
+            # Запоминаем колонки выгрузок, чтобы возвращать данные в той же схеме
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO store_columns (name) VALUES (?)",
+                [(column,) for column in STORE_COLUMNS if column in data.columns],
+            )
+
+        logger.info(f"Добавлено {inserted} новых транзакций из {len(rows)}.")
+        return inserted
+
+    def append_file(self, file_name: str, convert_currency: bool = True) -> int:
+        """Загружает выписку из excel-файла в хранилище"""
+        return self.append(load_transactions(file_name), convert_currency)
+
+    def rebuild_rollups(self) -> None:
+        """Пересчитывает дневные и месячные агрегаты по всем транзакциям"""
+        with self.connection:
+            for table, (period, length) in _ROLLUPS.items():
+                self.connection.execute(f"DELETE FROM {table}")
+                self.connection.execute(f"""
+                    INSERT INTO {table}
+                    SELECT substr(t.op_date, 1, {length}),
+                    {_ROLLUP_VALUES.format(row="t", agg="SUM", count="COUNT(*)")}
+                    FROM transactions AS t
+                    WHERE t.op_date IS NOT NULL
+                    GROUP BY 1, 2, 3, 4
+                    """)
+        logger.info("Агрегаты трат пересчитаны.")
+
+    def rollup(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        categories: Optional[list[str]] = None,
+        card: Optional[str] = None,
+        group_by: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """Считает расходы, доходы, кэшбэк и число операций за период по агрегатам, период задается днями"""
+        if group_by not in (None, "card", "category", "mcc"):
+            raise ValueError(f"Неизвестная группировка: {group_by}")
+
+        selects = []
+        params: list = []
+        for table, period, low, high in _rollup_parts(start, end):
+            conditions = ["1 = 1"]
+            if low is not None:
+                conditions.append(f"{period} >= ?")
+                params.append(low)
+            if high is not None:
+                conditions.append(f"{period} <= ?")
+                params.append(high)
+            if categories is not None:
+                conditions.append(f"category IN ({', '.join('?' * len(categories))})")
+                params.extend(categories)
+            if card is not None:
+                conditions.append("card = ?")
+                params.append(card)
+            selects.append(
+                f"SELECT card, category, mcc, spent, income, cashback, operations FROM {table} "
+                f"WHERE {' AND '.join(conditions)}"
+            )
+
+        group_column = f"{group_by}, " if group_by else ""
+        sql = (
+            f"SELECT {group_column}SUM(spent) AS spent, SUM(income) AS income, SUM(cashback) AS cashback, "
+            f"SUM(operations) AS operations FROM ({' UNION ALL '.join(selects)})"
+        )
+        if group_by:
+            sql += f" GROUP BY {group_by} ORDER BY {group_by}"
+        result = pd.read_sql_query(sql, self.connection, params=params)
+
+        if group_by:
+            # Пропуски в ключе возвращаются как NaN
+            result[group_by] = result[group_by].replace({"": np.nan, -1: np.nan})
+        else:
+            result = result.fillna(0)
+        return result
+
+    def rollup_totals(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        categories: Optional[list[str]] = None,
+        card: Optional[str] = None,
+    ) -> dict:
+        """Возвращает итоги за период: расходы, доходы, кэшбэк и число операций"""
+        totals = self.rollup(start, end, categories, card).iloc[0]
+        return {
+            "spent": float(totals["spent"]),
+            "income": float(totals["income"]),
+            "cashback": float(totals["cashback"]),
+            "operations": int(totals["operations"]),
+        }
+
+    def source_columns(self) -> list[str]:
+        """Возвращает колонки выгрузок, которые были загружены в хранилище"""
+        loaded = {row[0] for row in self.connection.execute("SELECT name FROM store_columns")}
+        return [column for column in STORE_COLUMNS if column in loaded or column == DATE_COLUMN]
+
+    def categories(self) -> list[str]:
+        """Возвращает список категорий, используя индекс по категории"""
+        cursor = self.connection.execute("SELECT DISTINCT category FROM transactions WHERE category IS NOT NULL")
+        return [row[0] for row in cursor]
+
+    def query(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        categories: Optional[list[str]] = None,
+        card: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> TransactionFrame:
+        """Выбирает транзакции с фильтрами, которые выполняются в SQLite по индексам"""
+        conditions = ["op_date IS NOT NULL"]
+        params: list = []
+        if start is not None:
+            conditions.append("op_date >= ?")
+            params.append(pd.Timestamp(start).strftime(STORE_DATE_FORMAT))
+        if end is not None:
+            conditions.append("op_date <= ?")
+            params.append(pd.Timestamp(end).strftime(STORE_DATE_FORMAT))
+        if categories is not None:
+            conditions.append(f"category IN ({', '.join('?' * len(categories))})")
+            params.extend(categories)
+        if card is not None:
+            conditions.append("card = ?")
+            params.append(card)
+        if search is not None and is_regex_query(search):
+            # Запрос с метасимволами трактуется как регулярное выражение, как при поиске по DataFrame
+            conditions.append("(description_folded REGEXP ? OR category_folded REGEXP ?)")
+            params.extend([search.lower(), search.lower()])
+        elif search is not None:
+            conditions.append("(instr(description_folded, ?) > 0 OR instr(category_folded, ?) > 0)")
+            params.extend([search.lower(), search.lower()])
+
+        columns = ", ".join(STORE_COLUMNS[column] for column in self.source_columns())
+        sql = f"SELECT {columns} FROM transactions WHERE {' AND '.join(conditions)} ORDER BY rowid"
+        df = pd.read_sql_query(sql, self.connection, params=params)
+
+        df = df.rename(columns={column: source for source, column in STORE_COLUMNS.items()})
+        df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN], format=STORE_DATE_FORMAT)
+        return TransactionFrame.from_raw(df)
+
+    def to_frame(self) -> TransactionFrame:
+        """Возвращает все транзакции с разобранной датой"""
+        return self.query()
@@ -0,0 +1,247 @@
+import heapq
+import logging
+from datetime import datetime
+from typing import Any, Hashable, Iterable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.transactions import AMOUNT_COLUMN, CARD_COLUMN, CATEGORY_COLUMN, DATE_COLUMN, DATE_FORMATS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+logger.addHandler(stream_handler)
+
+DESCRIPTION_COLUMN = "Описание"
+STATUS_COLUMN = "Статус"
+
+# Статусы операций, которые не попадают в топ: отклоненные и отмененные
+CANCELLED_STATUSES = {"FAILED", "CANCELLED", "REVERSED"}
+
+# Формат даты в записях топа
+TOP_DATE_FORMAT = "%d.%m.%Y"
+
+
+def top_n(data: pd.DataFrame, n: int = 5) -> pd.DataFrame:
+    """Возвращает n строк с наибольшей суммой операции без сортировки всех строк"""
+    if len(data) <= n:
+        return data.sort_values(AMOUNT_COLUMN, ascending=False, kind="stable")
+    amounts = data[AMOUNT_COLUMN].to_numpy(dtype="float64")
+    # Граница топа находится частичной сортировкой за O(len), сортируются только строки до границы;
+    # NaN попадают в конец, как у sort_values, равные суммы остаются в исходном порядке строк
+    keys = np.where(np.isnan(amounts), np.inf, -amounts)
+    boundary = np.partition(keys, n - 1)[n - 1]
+    candidates = np.flatnonzero(keys <= boundary)
+    order = candidates[np.lexsort((candidates, keys[candidates]))][:n]
+    return data.iloc[order]
+
+
+def top_records(top: pd.DataFrame) -> list[dict]:
+    """Переводит строки топа в записи вида {date, amount, category, description} по колонкам, а не по строкам"""
+    size = len(top)
+
+    def column_values(column: str) -> list:
+        if column not in top.columns:
+            return [None] * size
+        values = top[column].astype(object)
+        return values.where(values.notna(), None).tolist()
+
+    dates = top[DATE_COLUMN].dt.strftime(TOP_DATE_FORMAT).tolist()
+    amounts = top[AMOUNT_COLUMN].astype(float).tolist()
+    return [
+        {"date": date, "amount": amount, "category": category, "description": description}
+        for date, amount, category, description in zip(
+            dates, amounts, column_values(CATEGORY_COLUMN), column_values(DESCRIPTION_COLUMN)
+        )
+    ]
+
+
+def _group_keys(data: pd.DataFrame, group_by: str) -> pd.Series:
+    """Возвращает ключ группы каждой строки: категорию, карту или месяц операции"""
+    if group_by == "category":
+        return data[CATEGORY_COLUMN]
+    if group_by == "card":
+        return data[CARD_COLUMN]
+    if group_by == "month":
+        months: pd.Series = data[DATE_COLUMN].dt.strftime("%Y-%m")
+        return months
+    raise ValueError(f"Неизвестная группировка топа: {group_by}")
+
+
+def top_n_by_group(data: pd.DataFrame, n: int = 5, group_by: str = "category") -> dict[str, list[dict]]:
+    """Возвращает топ-n операций по сумме в каждой группе за один проход группировки"""
+    if data.empty:
+        return {}
+    keys = _group_keys(data, group_by)
+
+    # Место строки внутри своей группы считается одной векторной операцией, дальше обрабатываются только кандидаты
+    ranks = data[AMOUNT_COLUMN].groupby(keys, observed=True, sort=False).rank(method="first", ascending=False)
+    selected = (ranks <= n).to_numpy()
+    top = data[selected]
+    top_keys = keys[selected].astype(object)
+    order = np.lexsort((ranks[selected].to_numpy(), top_keys.astype(str).to_numpy()))
+    top = top.iloc[order]
+    top_keys = top_keys.iloc[order]
+
+    result: dict[str, list[dict]] = {}
+    for key, record in zip(top_keys.tolist(), top_records(top)):
+        result.setdefault(str(key), []).append(record)
+    return result
+
+
+def top_n_report(data: pd.DataFrame, n: int = 5, group_by: Iterable[str] = ()) -> dict:
+    """Возвращает общий топ-n и топ-n по каждой из группировок для всех виджетов за один вызов"""
+    result: dict[str, Any] = {"top_transactions": top_records(top_n(data, n))}
+    for key in group_by:
+        result[f"top_by_{key}"] = top_n_by_group(data, n, key)
+    return result
+
+
+def _parse_date(value: Union[str, datetime, pd.Timestamp, None]) -> Optional[pd.Timestamp]:
+    """Разбирает дату одной операции в любом из форматов выгрузки, для пропуска или неверной даты возвращает None"""
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return pd.Timestamp(value)
+    for date_format in DATE_FORMATS:
+        try:
+            return pd.Timestamp(datetime.strptime(str(value), date_format))
+        except ValueError:
+            continue
+    return None
+
+
+def _optional(value: Any) -> Any:
+    """Заменяет пропуск на None для JSON"""
+    return None if value is None or pd.isna(value) else value
+
+
+class IncrementalTopN:
+    """Топ-n операций с начала месяца по картам, который обновляется по мере поступления транзакций"""
+
+    def __init__(self, n: int = 5, keep_months: int = 2):
+        self.n = n
+        # Сколько последних месяцев хранится для поздних исправлений
+        self.keep_months = keep_months
+        # Все операции группы (месяц, карта) и ограниченная куча из n лучших для каждой группы
+        self.records: dict[tuple[str, Optional[str]], dict[Hashable, tuple[tuple[float, int], dict, pd.Timestamp]]] = (
+            {}
+        )
+        self.heaps: dict[tuple[str, Optional[str]], list[tuple[tuple[float, int], Hashable]]] = {}
+        self.locations: dict[Hashable, tuple[str, Optional[str]]] = {}
+        self.current_month: Optional[str] = None
+        # Самая поздняя дата добавленной операции: топ на более позднюю дату берется прямо из куч
+        self.last_date: Optional[pd.Timestamp] = None
+        self.sequence = 0
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def append(self, transaction: dict, tx_id: Optional[Hashable] = None) -> None:
+        """Добавляет операцию; операция с уже известным tx_id заменяет прежнюю, отмененная удаляет ее"""
+        self.sequence += 1
+        tx_id = self.sequence if tx_id is None else tx_id
+        if tx_id in self.locations:
+            self.cancel(tx_id)
+
+        if str(transaction.get(STATUS_COLUMN, "")).upper() in CANCELLED_STATUSES:
+            return
+        amount = transaction.get(AMOUNT_COLUMN)
+        if amount is None or pd.isna(amount):
+            return
+
+        date = _parse_date(transaction.get(DATE_COLUMN))
+        if date is None:
+            logger.warning(f"Операция {tx_id} без даты или с неверной датой пропущена")
+            return
+        month = date.strftime("%Y-%m")
+        if self.current_month is None or month > self.current_month:
+            self._roll_over(month)
+        elif month < self._oldest_month():
+            logger.warning(f"Операция {tx_id} за {month} старше хранимых месяцев и пропущена")
+            return
+
+        card = transaction.get(CARD_COLUMN)
+        group = (month, None if card is None or pd.isna(card) else str(card))
+        # Ключ сравнения: сумма, при равенстве раньше поступившая операция выше
+        key = (float(amount), -self.sequence)
+        record = {
+            "date": date.strftime(TOP_DATE_FORMAT),
+            "amount": float(amount),
+            "category": _optional(transaction.get(CATEGORY_COLUMN)),
+            "description": _optional(transaction.get(DESCRIPTION_COLUMN)),
+        }
+        self.records.setdefault(group, {})[tx_id] = (key, record, date)
+        self.locations[tx_id] = group
+        if self.last_date is None or date > self.last_date:
+            self.last_date = date
+
+        heap = self.heaps.setdefault(group, [])
+        if len(heap) < self.n:
+            heapq.heappush(heap, (key, tx_id))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, tx_id))
+
+    def append_frame(self, data: pd.DataFrame, id_column: Optional[str] = None) -> None:
+        """Добавляет операции из DataFrame по порядку строк"""
+        for transaction in data.to_dict(orient="records"):
+            self.append(transaction, transaction.get(id_column) if id_column else None)
+
+    def cancel(self, tx_id: Hashable) -> bool:
+        """Удаляет операцию (отмена или возврат); возвращает False, если операции нет"""
+        group = self.locations.pop(tx_id, None)
+        if group is None:
+            return False
+        self.records[group].pop(tx_id)
+
+        heap = self.heaps[group]
+        if any(heap_id == tx_id for _, heap_id in heap):
+            # Из топа ушла операция: куча группы пересобирается из ее операций за O(m log n)
+            heap[:] = heapq.nlargest(self.n, ((key, heap_id) for heap_id, (key, _, _) in self.records[group].items()))
+            heapq.heapify(heap)
+        return True
+
+    def top(
+        self,
+        month: Optional[str] = None,
+        card: Optional[str] = None,
+        end: Optional[datetime] = None,
+        n: Optional[int] = None,
+    ) -> list[dict]:
+        """Возвращает топ-n операций месяца (по умолчанию текущего) по карте или по всем картам до даты end"""
+        month = month or self.current_month
+        n = self.n if n is None else n
+        groups = [group for group in self.heaps if group[0] == month and card in (None, group[1])]
+
+        if n <= self.n and (end is None or self.last_date is None or pd.Timestamp(end) >= self.last_date):
+            # Общий топ месяца собирается из топов карт, а не из всех операций
+            candidates = [item for group in groups for item in self.heaps[group]]
+        else:
+            # В кучах только n лучших без учета даты: топ на прошлую дату или больший топ считается по всем операциям
+            logger.warning(f"Топ-{n} на {end} не покрывается кучами топ-{self.n}, операции месяца перебираются")
+            end = pd.Timestamp(end) if end is not None else None
+            candidates = [
+                (key, tx_id)
+                for group in groups
+                for tx_id, (key, _, date) in self.records[group].items()
+                if end is None or date <= end
+            ]
+        best = heapq.nlargest(n, candidates)
+        return [self.records[self.locations[tx_id]][tx_id][1] for _, tx_id in best]
+
+    def _oldest_month(self) -> str:
+        """Возвращает самый старый хранимый месяц"""
+        return (pd.Period(self.current_month, "M") - (self.keep_months - 1)).strftime("%Y-%m")
+
+    def _roll_over(self, month: str) -> None:
+        """Переходит на новый месяц и удаляет группы месяцев, которые больше не хранятся"""
+        self.current_month = month
+        oldest = self._oldest_month()
+        for group in [group for group in self.records if group[0] < oldest]:
+            for tx_id in self.records.pop(group):
+                self.locations.pop(tx_id, None)
+            self.heaps.pop(group, None)
+        logger.info(f"Топ операций переключен на месяц {month}")
@@ -0,0 +1,220 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from src.read_excel import NUMERIC_COLUMNS, read_excel_cached, read_excel_file
+from src.search_index import SearchIndex
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+logger.addHandler(stream_handler)
+
+DATE_COLUMN = "Дата операции"
+CARD_COLUMN = "Номер карты"
+CATEGORY_COLUMN = "Категория"
+MCC_COLUMN = "MCC"
+AMOUNT_COLUMN = "Сумма операции"
+
+# Форматы дат, которые встречаются в выгрузках, в порядке проверки
+DATE_FORMATS = ["%d.%m.%Y %H:%M:%S", "%d.%m.%Y", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y.%m.%d %H:%M:%S"]
+
+# Формат, в котором даты отдаются обратно в JSON
+DATE_OUTPUT_FORMAT = "%d.%m.%Y %H:%M:%S"
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """Разбирает даты, пробуя известные форматы выгрузки по очереди"""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    result = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for date_format in DATE_FORMATS:
+        # Каждый следующий формат применяется только к еще не разобранным значениям
+        pending = result.isna() & values.notna()
+        if not pending.any():
+            break
+        result[pending] = pd.to_datetime(values[pending], format=date_format, errors="coerce")
+    return result
+
+
+def parse_amounts(values: pd.Series) -> pd.Series:
+    """Приводит суммы к float, в том числе строки вида '-160,89'"""
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float64")
+    cleaned = values.astype(str).str.replace(r"\s", "", regex=True).str.replace(",", ".")
+    return pd.to_numeric(cleaned, errors="coerce").astype("float64")
+
+
+def normalize_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит колонки выгрузки к типам: даты, категории, MCC, суммы и номера карт"""
+    data = df.copy()
+
+    if DATE_COLUMN in data.columns:
+        data[DATE_COLUMN] = parse_dates(data[DATE_COLUMN])
+        unparsed = int(data[DATE_COLUMN].isna().sum())
+        if unparsed:
+            logger.warning(f"Не удалось разобрать {unparsed} дат операций.")
+
+    for column in NUMERIC_COLUMNS:
+        if column in data.columns and column != MCC_COLUMN:
+            data[column] = parse_amounts(data[column])
+
+    if MCC_COLUMN in data.columns:
+        data[MCC_COLUMN] = parse_amounts(data[MCC_COLUMN]).round().astype("Int64")
+
+    if CATEGORY_COLUMN in data.columns:
+        data[CATEGORY_COLUMN] = data[CATEGORY_COLUMN].astype("category")
+
+    if CARD_COLUMN in data.columns:
+        # Номера карт хранятся один раз в словаре категорий, строки ссылаются на них кодами
+        cards = data[CARD_COLUMN]
+        data[CARD_COLUMN] = cards.where(cards.isna(), cards.astype(str)).astype("category")
+
+    return data
+
+
+class DateIndex:
+    """Отсортированный индекс дат операций для запросов по диапазону дат"""
+
+    def __init__(self, dates: pd.Series):
+        values = dates.to_numpy(dtype="datetime64[ns]")
+        valid_positions = np.flatnonzero(~np.isnat(values))
+        order = np.argsort(values[valid_positions], kind="stable")
+        # Позиции строк в порядке возрастания даты, строки без даты в индекс не попадают
+        self.positions = valid_positions[order]
+        self.sorted_dates = values[self.positions]
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def range_positions(self, start: datetime, end: datetime) -> np.ndarray:
+        """Возвращает позиции строк с датой в диапазоне [start, end] за O(log n + k)"""
+        left = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(start), "ns"), side="left")
+        right = np.searchsorted(self.sorted_dates, np.datetime64(pd.Timestamp(end), "ns"), side="right")
+        return self.positions[left:right]
+
+
+class TransactionFrame:
+    """Транзакции, нормализованные один раз при загрузке"""
+
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+        self._date_index: Optional[DateIndex] = None
+        self._search_index: Optional[SearchIndex] = None
+
+    @classmethod
+    def from_raw(cls, df: pd.DataFrame) -> "TransactionFrame":
+        """Создает TransactionFrame из сырого DataFrame выгрузки"""
+        return cls(normalize_transactions(df))
+
+    @property
+    def empty(self) -> bool:
+        return self.data.empty
+
+    @property
+    def columns(self) -> pd.Index:
+        return self.data.columns
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def date_index(self) -> DateIndex:
+        """Индекс дат, строится при первом запросе и переиспользуется"""
+        if self._date_index is None:
+            self._date_index = DateIndex(self.data[DATE_COLUMN])
+        return self._date_index
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """Индекс поиска по описанию и категории, строится при первом запросе и переиспользуется"""
+        if self._search_index is None:
+            self._search_index = SearchIndex(self.data)
+        return self._search_index
+
+    def between(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """Возвращает транзакции с датой операции в диапазоне [start, end] в исходном порядке строк"""
+        positions = np.sort(self.date_index.range_positions(start, end))
+        return self.data.iloc[positions]
+
+    def dropna_dates(self) -> "TransactionFrame":
+        """Возвращает транзакции без строк с неразобранной датой"""
+        if DATE_COLUMN not in self.data.columns or not self.data[DATE_COLUMN].isna().any():
+            return self
+        return TransactionFrame(self.data.dropna(subset=[DATE_COLUMN]))
+
+
+def as_transaction_frame(transactions: Union[pd.DataFrame, list[dict], TransactionFrame]) -> TransactionFrame:
+    """Возвращает TransactionFrame, нормализуя сырые данные только при необходимости"""
+    if isinstance(transactions, TransactionFrame):
+        return transactions
+    return TransactionFrame.from_raw(pd.DataFrame(transactions))
+
+
+def load_transactions(file_name: str, use_cache: bool = True) -> TransactionFrame:
+    """Считывает excel-файл и сразу нормализует транзакции"""
+    df = read_excel_cached(file_name) if use_cache else read_excel_file(file_name)
+    return TransactionFrame.from_raw(df)
+
+
+def _ingest_file(file_name: str, use_cache: bool = True) -> tuple[Optional[pd.DataFrame], float, Optional[str]]:
+    """Считывает и нормализует один файл, возвращает данные, время обработки и ошибку"""
+    started = time.perf_counter()
+    try:
+        data = load_transactions(file_name, use_cache).data
+        return data, time.perf_counter() - started, None
+    except Exception as e:
+        return None, time.perf_counter() - started, str(e)
+
+
+def load_transactions_many(
+    file_names: list[str], max_workers: Optional[int] = None, use_cache: bool = True
+) -> tuple[TransactionFrame, list[dict]]:
+    """Параллельно считывает несколько выписок и объединяет их в один TransactionFrame"""
+    started = time.perf_counter()
+    if max_workers == 1 or len(file_names) <= 1:
+        results = [_ingest_file(file_name, use_cache) for file_name in file_names]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # map сохраняет порядок файлов, поэтому результат не зависит от того, какой процесс закончил первым
+            results = list(executor.map(_ingest_file, file_names, repeat(use_cache)))
+
+    frames = []
+    report = []
+    for file_name, (data, seconds, error) in zip(file_names, results):
+        report.append(
+            {"file": file_name, "rows": 0 if data is None else len(data), "seconds": round(seconds, 3), "error": error}
+        )
+        if error or data is None:
+            logger.error(f"Ошибка при загрузке {file_name}: {error}")
+        else:
+            logger.info(f"Файл {file_name} загружен за {seconds:.3f} с, строк: {len(data)}")
+            frames.append(data)
+
+    # Колонки всех файлов приводятся к одной схеме; категории файлов объединяются повторной нормализацией
+    merged = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=[DATE_COLUMN])
+    frame = TransactionFrame.from_raw(merged)
+
+    logger.info(f"Загружено {len(file_names)} файлов за {time.perf_counter() - started:.3f} с, строк: {len(frame)}")
+    return frame, report
+
+
+def to_plain_frame(df: pd.DataFrame, date_format: str = DATE_OUTPUT_FORMAT) -> pd.DataFrame:
+    """Переводит типизированные колонки обратно в значения, пригодные для JSON"""
+    result = df.copy()
+    for column in result.columns:
+        values = result[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            result[column] = values.dt.strftime(date_format)
+        elif isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_extension_array_dtype(values):
+            result[column] = values.astype(object).where(values.notna(), None)
+    return result
@@ -1,10 +1,19 @@
+import copy
+import hashlib
 import json
 import logging
 import os
+import random
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Hashable, Optional, Union
+from urllib.parse import urlencode, urlparse
 
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 load_dotenv()
 
@@ -28,20 +37,369 @@ file_handler.setFormatter(formatter)
 # Добавление обработчика к логгеру
 logger.addHandler(file_handler)
 
+# Лимит бесплатного ключа Alpha Vantage: 5 запросов в минуту
+ALPHAVANTAGE_RATE = 5
+ALPHAVANTAGE_PERIOD = 60.0
+
+# Таймаут одного запроса к API в секундах
+REQUEST_TIMEOUT = 10
+
+# Число одновременных запросов цен акций
+STOCK_MAX_WORKERS = 5
+
+# Размер пула keep-alive соединений на хост
+HTTP_POOL_SIZE = 10
+
+# Число повторов запроса и базовая задержка экспоненциального ожидания между ними в секундах
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+
+# Коды ответа, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Дольше этого ответ с Retry-After не ожидается: запрос не повторяется, ответ возвращается как есть
+HTTP_MAX_RETRY_AFTER = 30.0
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Счетчики запросов по хостам: число запросов, ошибок и суммарное время
+_http_stats: dict[str, dict] = {}
+_stats_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Возвращает общую сессию с пулом соединений, создавая ее при первом обращении"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _record_http_call(host: str, seconds: float, is_error: bool) -> None:
+    """Добавляет запрос в счетчики хоста"""
+    with _stats_lock:
+        stats = _http_stats.setdefault(host, {"requests": 0, "errors": 0, "total_seconds": 0.0})
+        stats["requests"] += 1
+        stats["errors"] += int(is_error)
+        stats["total_seconds"] += seconds
+
+
+def get_http_stats() -> dict[str, dict]:
+    """Возвращает счетчики запросов по хостам: число запросов, ошибок, суммарное и среднее время"""
+    with _stats_lock:
+        return {
+            host: {**stats, "avg_seconds": stats["total_seconds"] / stats["requests"]}
+            for host, stats in _http_stats.items()
+        }
+
+
+def reset_http_stats() -> None:
+    """Сбрасывает счетчики запросов"""
+    with _stats_lock:
+        _http_stats.clear()
+
+
+class LiveTransport:
+    """Транспорт, который отправляет запросы в сеть через общую сессию"""
+
+    def get(self, url: str, params: Optional[dict], headers: Optional[dict], timeout: float) -> requests.Response:
+        return get_http_session().get(url, params=params, headers=headers, timeout=timeout)
+
+
+def _request_key(url: str, params: Optional[dict]) -> str:
+    """Возвращает имя файла записи для запроса; ключи API в имя не попадают"""
+    query = urlencode(sorted((key, value) for key, value in (params or {}).items() if key.lower() != "apikey"))
+    return hashlib.sha1(f"{url}?{query}".encode("utf-8")).hexdigest()
+
+
+class RecordingTransport:
+    """Транспорт, который отправляет запросы через вложенный транспорт и сохраняет ответы на диск"""
+
+    def __init__(self, directory: str, transport: Optional[LiveTransport] = None):
+        self.directory = directory
+        self.transport = transport or LiveTransport()
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str, params: Optional[dict], headers: Optional[dict], timeout: float) -> requests.Response:
+        response = self.transport.get(url, params, headers, timeout)
+        record = {
+            "url": url,
+            "params": {key: value for key, value in (params or {}).items() if key.lower() != "apikey"},
+            "status_code": response.status_code,
+            "headers": {"Content-Type": response.headers.get("Content-Type", "application/json")},
+            "body": response.text,
+        }
+        with open(os.path.join(self.directory, f"{_request_key(url, params)}.json"), "w", encoding="utf-8") as file:
+            json.dump(record, file, ensure_ascii=False)
+        return response
+
+
+class ReplayTransport:
+    """Транспорт, который отдает записанные ответы с искусственной задержкой и внедрением ошибок"""
+
+    def __init__(
+        self,
+        directory: str,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # Код ответа для внедренных ошибок; если не задан, внедряется таймаут
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def get(self, url: str, params: Optional[dict], headers: Optional[dict], timeout: float) -> requests.Response:
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            is_error = self.random.random() < self.error_rate
+
+        # Ответ медленнее таймаута ведет себя как настоящий таймаут
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise requests.exceptions.ReadTimeout(f"Задержка {delay:.3f} с больше таймаута {timeout} с")
+        if is_error and self.error_status is None:
+            raise requests.exceptions.ConnectTimeout("Внедренная ошибка соединения")
+
+        response = requests.Response()
+        response.url = url
+        response.encoding = "utf-8"
+        if is_error and self.error_status is not None:
+            response.status_code = self.error_status
+            response.reason = "Injected error"
+            response._content = b"{}"
+            return response
+
+        path = os.path.join(self.directory, f"{_request_key(url, params)}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                record = json.load(file)
+        except FileNotFoundError:
+            raise requests.exceptions.ConnectionError(f"Нет записанного ответа для {url}")
+
+        response.status_code = record["status_code"]
+        response.reason = "OK" if response.status_code < 400 else "Recorded error"
+        response.headers.update(record["headers"])
+        response._content = record["body"].encode("utf-8")
+        return response
+
+
+# Транспорт, через который http_get отправляет запросы
+_transport: Union[LiveTransport, RecordingTransport, ReplayTransport] = LiveTransport()
+
+
+def set_transport(transport: Union[LiveTransport, RecordingTransport, ReplayTransport]) -> None:
+    """Заменяет транспорт запросов к API: сеть, запись ответов на диск или воспроизведение записей"""
+    global _transport
+    _transport = transport
+
+
+def get_transport() -> Union[LiveTransport, RecordingTransport, ReplayTransport]:
+    """Возвращает текущий транспорт запросов к API"""
+    return _transport
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Возвращает задержку из заголовка Retry-After в секундах, если она задана числом"""
+    try:
+        return max(float(response.headers["Retry-After"]), 0.0)
+    except (KeyError, ValueError):
+        return None
+
+
+def http_get(
+    url: str,
+    params: Optional[dict] = None,
+    headers: Optional[dict] = None,
+    timeout: float = REQUEST_TIMEOUT,
+    retries: Optional[int] = None,
+    limiter: Optional["RateLimiter"] = None,
+    limiter_timeout: Optional[float] = None,
+) -> requests.Response:
+    """Выполняет GET-запрос через текущий транспорт с таймаутом и повторами с экспоненциальным ожиданием"""
+    retries = HTTP_RETRIES if retries is None else retries
+    host = urlparse(url).netloc
+
+    for attempt in range(retries + 1):
+        # Каждая попытка, включая повторы, расходует токен лимитера хоста
+        if limiter is not None and not limiter.acquire(timeout=limiter_timeout):
+            raise requests.exceptions.RetryError(f"Превышен лимит запросов к {host}")
+
+        started = time.perf_counter()
+        try:
+            response = _transport.get(url, params, headers, timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            _record_http_call(host, time.perf_counter() - started, True)
+            if attempt == retries:
+                raise
+            logger.warning(f"Ошибка соединения с {host}, попытка {attempt + 1}: {e}")
+        else:
+            _record_http_call(host, time.perf_counter() - started, response.status_code >= 400)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            retry_after = _retry_after(response)
+            if retry_after is not None and retry_after > HTTP_MAX_RETRY_AFTER:
+                logger.warning(f"Ответ {response.status_code} от {host}: повтор не раньше чем через {retry_after} с")
+                return response
+            logger.warning(f"Ответ {response.status_code} от {host}, попытка {attempt + 1}")
+            if retry_after is not None:
+                time.sleep(retry_after)
+                continue
+
+        # Случайная добавка к задержке разносит повторы параллельных запросов во времени
+        time.sleep(HTTP_BACKOFF * 2**attempt * random.uniform(0.5, 1.5))
+
+    # Цикл завершается без ответа только при отрицательном числе повторов
+    raise ValueError(f"Число повторов не может быть отрицательным: {retries}")
+
+
+class RateLimiter:
+    """Ограничитель частоты запросов по алгоритму token bucket"""
+
+    def __init__(self, rate: int, period: float):
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / period
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Забирает токен, при необходимости ожидая его появления; False, если не дождались за timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.fill_rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+# Общий для всех потоков лимитер запросов к Alpha Vantage
+alphavantage_limiter = RateLimiter(ALPHAVANTAGE_RATE, ALPHAVANTAGE_PERIOD)
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один вызов с общим результатом"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.in_flight: dict[Hashable, Future] = {}
+        # Счетчики по первому элементу ключа (API-методу): всего вызовов, выполнено и сэкономлено
+        self.stats: dict[Hashable, dict[str, int]] = {}
+
+    def do(self, key: tuple, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Выполняет func или дожидается уже идущего вызова с тем же ключом"""
+        with self.lock:
+            stats = self.stats.setdefault(key[0], {"calls": 0, "executed": 0, "saved": 0})
+            stats["calls"] += 1
+            running = self.in_flight.get(key)
+            if running is None:
+                future: Future = Future()
+                self.in_flight[key] = future
+                stats["executed"] += 1
+            else:
+                stats["saved"] += 1
+
+        if running is not None:
+            return running.result()
+
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def get_stats(self) -> dict[Hashable, dict[str, int]]:
+        """Возвращает копию счетчиков вызовов"""
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+
+# Общий для всех потоков слой объединения запросов к API
+upstream_calls = SingleFlight()
+
+
+def get_single_flight_stats() -> dict[Hashable, dict[str, int]]:
+    """Возвращает по каждому API-методу число вызовов, выполненных запросов и сэкономленных запросов"""
+    return upstream_calls.get_stats()
+
+
+# Каталог кэша дневных котировок, по одному json-файлу на акцию
+STOCK_CACHE_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "stock_cache")
+
+# Сколько секунд котировки текущего дня считаются свежими
+STOCK_TODAY_TTL = 15 * 60
+
+# Ответ outputsize=compact содержит последние 100 торговых дней, это примерно 140 календарных
+COMPACT_DAYS = 130
+
+
+# Загруженные настройки по абсолютному пути файла вместе с его размером и временем изменения
+_settings_cache: dict[str, tuple[tuple[int, int], dict]] = {}
+_settings_lock = threading.Lock()
+
+# Функции, которые вызываются после перечитывания измененного файла настроек
+_settings_reload_hooks: list[Callable[[str, dict], None]] = []
+
+
+def add_settings_reload_hook(hook: Callable[[str, dict], None]) -> None:
+    """Регистрирует функцию, которая получит путь и новые настройки после изменения файла настроек"""
+    _settings_reload_hooks.append(hook)
+
+
+def reload_user_settings(file_path: Optional[str] = None) -> None:
+    """Сбрасывает кэш настроек одного файла или всех файлов, следующий вызов перечитает их с диска"""
+    with _settings_lock:
+        if file_path is None:
+            _settings_cache.clear()
+        else:
+            _settings_cache.pop(os.path.abspath(file_path), None)
+
 
 def get_load_user_setting(file_path="../user_settings.json"):
     """Функция для загрузки пользовательских настроек из файла user_settings.json"""
+    settings_file = os.path.abspath(file_path)
+
+    # Файл перечитывается только после изменения; если stat недоступен, настройки читаются без кэша
     try:
-        settings_file = os.path.abspath(file_path)
+        stat = os.stat(settings_file)
+        version = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        version = None
 
+    with _settings_lock:
+        cached = _settings_cache.get(settings_file)
+    if version is not None and cached and cached[0] == version:
+        return copy.deepcopy(cached[1])
+
+    try:
         with open(settings_file, "r", encoding="utf-8") as file:
             settings = json.load(file)
         logging.info(f"Настройки успешно загружены из {file_path}")
 
-        print(settings)  # Вывод для отладки
-
-        return settings
-
     except FileNotFoundError:
         logging.error(f"Файл настроек не найден: {settings_file}")
         return None
@@ -49,6 +407,15 @@ def get_load_user_setting(file_path="../user_settings.json"):
         logging.error(f"Ошибка при загрузке настроек: {e}")
         return None
 
+    if version is not None:
+        with _settings_lock:
+            _settings_cache[settings_file] = (version, settings)
+        if cached:
+            for hook in _settings_reload_hooks:
+                hook(settings_file, copy.deepcopy(settings))
+
+    return copy.deepcopy(settings)
+
 
 # if __name__ == "__main__":
 #     settings = get_load_user_setting()
@@ -59,6 +426,14 @@ def get_load_user_setting(file_path="../user_settings.json"):
 #         print("Не удалось загрузить настройки.")
 
 
+def _get_json(url: str, headers: Optional[dict] = None) -> dict:
+    """Отправляет get-запрос к API, проверяет успешность и разбирает JSON-ответ"""
+    response = http_get(url, headers=headers)
+    response.raise_for_status()
+    data: dict = response.json()
+    return data
+
+
 def get_exchange_rates():
     """Получает данных о курсах валют с использованием API"""
 
@@ -81,9 +456,8 @@ def get_exchange_rates():
     headers = {"apikey": api_key}
 
     try:
-        response = requests.get(api_url, headers=headers)  # Отправляем get-запрос к API
-        response.raise_for_status()  # Проверка успешности запроса
-        data = response.json()  # Парсим JSON-ответ
+        # Одновременные запросы тех же курсов выполняются одним обращением к API
+        data = upstream_calls.do(("exchange_rates", symbols, base_currency), _get_json, api_url, headers)
 
         for currency in user_currencies:
             if currency in data["rates"]:
@@ -109,7 +483,108 @@ def get_exchange_rates():
 #         print("Не удалось получить курсы валют.")
 
 
-def get_stock_prices(api_key: str, settings_file: str, date: str) -> dict:
+def _stock_cache_path(symbol: str) -> str:
+    """Возвращает путь к файлу кэша котировок акции"""
+    return os.path.join(STOCK_CACHE_DIR, f"{symbol}.json")
+
+
+def _load_stock_cache(symbol: str) -> dict:
+    """Загружает кэш котировок акции: цены закрытия по датам, время и дату последней загрузки"""
+    try:
+        with open(_stock_cache_path(symbol), "r", encoding="utf-8") as file:
+            cache: dict = json.load(file)
+            return cache
+    except (OSError, ValueError):
+        return {"series": {}, "fetched_at": 0, "covered_until": None}
+
+
+def _save_stock_cache(symbol: str, cache: dict) -> None:
+    """Сохраняет кэш котировок атомарной заменой файла"""
+    os.makedirs(STOCK_CACHE_DIR, exist_ok=True)
+    path = _stock_cache_path(symbol)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(cache, file)
+    os.replace(tmp_path, path)
+
+
+def _cached_stock_price(cache: dict, date: str, today: str, today_ttl: float) -> tuple[bool, Optional[float]]:
+    """Ищет цену в кэше; возвращает признак попадания и цену (None, если торгов в этот день не было)"""
+    series = cache["series"]
+    covered_until = cache.get("covered_until")
+    if date >= today:
+        # Котировки текущего дня еще могут измениться, поэтому они живут только today_ttl секунд
+        if covered_until == today and time.time() - cache["fetched_at"] < today_ttl:
+            return True, series.get(date)
+        return False, None
+
+    if date in series:
+        return True, series[date]
+    # Прошедший день внутри загруженного диапазона без котировки - выходной или праздник
+    if series and covered_until and min(series) <= date < covered_until:
+        return True, None
+    return False, None
+
+
+def _fetch_stock_price(
+    symbol: str, api_key: str, date: str, timeout: float, today_ttl: float = STOCK_TODAY_TTL
+) -> Optional[float]:
+    """Возвращает цену закрытия одной акции на дату из кэша или API, None при ошибке или отсутствии данных"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    cache = _load_stock_cache(symbol)
+    hit, price = _cached_stock_price(cache, date, today, today_ttl)
+    if hit:
+        logger.debug(f"Цена {symbol} на {date} взята из кэша")
+        return price
+
+    # Если кэш покрывает историю до нужной даты, догружается только хвост, иначе вся история
+    compact_from = (datetime.now() - timedelta(days=COMPACT_DAYS)).strftime("%Y-%m-%d")
+    covered_until = cache.get("covered_until")
+    is_compact = date >= compact_from and (not cache["series"] or (covered_until or "") >= compact_from)
+
+    url = "https://www.alphavantage.co/query"
+    params = {
+        "function": "TIME_SERIES_DAILY",
+        "symbol": symbol,
+        "apikey": api_key,
+        "outputsize": "compact" if is_compact else "full",
+    }
+
+    try:
+        # Токен лимитера берется на каждую попытку, чтобы повторы не превышали лимит запросов в минуту
+        response = http_get(
+            url, params=params, timeout=timeout, limiter=alphavantage_limiter, limiter_timeout=ALPHAVANTAGE_PERIOD
+        )
+        response.raise_for_status()
+        data = response.json()
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Ошибка запроса для {symbol}: {e}")
+        return None
+
+    # Логирование полного ответа для отладки
+    logger.debug(f"Ответ от API для {symbol}: {data}")
+
+    # Проверка наличия данных и обработки ошибок
+    if "Time Series (Daily)" in data:
+        time_series = data["Time Series (Daily)"]
+        cache["series"].update({day: float(values["4. close"]) for day, values in time_series.items()})
+        cache["fetched_at"] = time.time()
+        cache["covered_until"] = today
+        _save_stock_cache(symbol, cache)
+
+        if date in time_series:
+            return float(time_series[date]["4. close"])  # Цена закрытия
+        logger.warning(f"Нет данных для {symbol} на дату {date}")
+    elif "Information" in data:
+        logger.error(f"Ошибка в данных для {symbol}: {data['Information']}")
+    else:
+        logger.error(f"Ошибка в данных для {symbol}: {data.get('Error Message', 'Неизвестная ошибка')}")
+    return None
+
+
+def get_stock_prices(
+    api_key: str, settings_file: str, date: str, timeout: float = REQUEST_TIMEOUT, today_ttl: float = STOCK_TODAY_TTL
+) -> list[dict]:
     """Получает цены на акции на определенную дату"""
     # Загрузка настроек пользователя
     user_settings = get_load_user_setting(settings_file)
@@ -118,42 +593,26 @@ def get_stock_prices(api_key: str, settings_file: str, date: str) -> dict:
 
     # Получение списка символов акций из настроек
     user_stocks = user_settings.get("user_stocks", [])
-    prices = []
-
-    # URL для запроса
-    url = "https://www.alphavantage.co/query"
+    if not user_stocks:
+        return []
 
-    for symbol in user_stocks:
-        params = {"function": "TIME_SERIES_DAILY", "symbol": symbol, "apikey": api_key}
+    # Дата может прийти вместе со временем, котировки хранятся по дням
+    date = date[:10]
 
-        try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            # Логирование полного ответа для отладки
-            logger.debug(f"Ответ от API для {symbol}: {data}")
-
-            # Проверка наличия данных и обработки ошибок
-            if "Time Series (Daily)" in data:
-                time_series = data["Time Series (Daily)"]
-                if date in time_series:
-                    price = float(time_series[date]["4. close"])  # Цена закрытия
-                    prices.append({"stock": symbol, "price": price})
-                else:
-                    logger.warning(f"Нет данных для {symbol} на дату {date}")
-            elif "Information" in data:
-                error_message = data["Information"]
-                logger.error(f"Ошибка в данных для {symbol}: {error_message}")
-            else:
-                error_message = data.get("Error Message", "Неизвестная ошибка")
-                logger.error(f"Ошибка в данных для {symbol}: {error_message}")
+    # Акции запрашиваются параллельно, частоту запросов ограничивает общий лимитер
+    # Одновременные запросы той же акции на ту же дату из разных отчетов объединяются в один
+    def fetch(symbol: str) -> Optional[float]:
+        price: Optional[float] = upstream_calls.do(
+            ("TIME_SERIES_DAILY", symbol, date), _fetch_stock_price, symbol, api_key, date, timeout, today_ttl
+        )
+        return price
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка запроса для {symbol}: {e}")
-            # В случае сетевой ошибки, подождите перед следующим запросом
-            time.sleep(1)
+    with ThreadPoolExecutor(max_workers=min(STOCK_MAX_WORKERS, len(user_stocks))) as executor:
+        results = list(executor.map(fetch, user_stocks))
 
+    # Акции, по которым не удалось получить цену, пропускаются, остальные возвращаются в порядке настроек
+    prices = [{"stock": symbol, "price": price} for symbol, price in zip(user_stocks, results) if price is not None]
+    logger.info(f"Получены цены {len(prices)} из {len(user_stocks)} акций")
     return prices
 
 
@@ -167,3 +626,85 @@ def get_stock_prices(api_key: str, settings_file: str, date: str) -> dict:
 #         print(json.dumps(stock_prices, indent=4, ensure_ascii=False))
 #     else:
 #         print("Не удалось получить данные о ценах на акции.")
+
+
+# Сколько секунд значение считается свежим и сколько его еще можно отдавать, обновляя в фоне
+SWR_FRESH_TTL = 60.0
+SWR_MAX_STALE = 60 * 60.0
+
+# Пул потоков для фонового обновления значений
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="swr_refresh")
+
+
+class StaleWhileRevalidateCache:
+    """Кэш, который сразу отдает последнее известное значение и обновляет устаревшее в фоне"""
+
+    def __init__(self, fresh_ttl: float = SWR_FRESH_TTL, max_stale: float = SWR_MAX_STALE):
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.entries: dict[Hashable, tuple[float, Any]] = {}
+        self.refreshing: set[Hashable] = set()
+        self.lock = threading.Lock()
+
+    def get(
+        self, key: Hashable, loader: Callable[[], Any], max_stale: Optional[float] = None
+    ) -> tuple[Any, Optional[float]]:
+        """Возвращает значение и его возраст в секундах; возраст None, если значение получить не удалось"""
+        max_stale = self.max_stale if max_stale is None else max_stale
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry:
+            age = time.time() - entry[0]
+            if age <= max_stale:
+                if age > self.fresh_ttl:
+                    self._refresh_in_background(key, loader)
+                return entry[1], age
+
+        # Значения нет или оно слишком старое: загрузка выполняется сразу
+        value = self._load(key, loader)
+        return (value, 0.0) if value else (value, None)
+
+    def _load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Загружает значение; пустой результат (ошибка API) не затирает последнее известное значение"""
+        value = loader()
+        if value:
+            with self.lock:
+                self.entries[key] = (time.time(), value)
+        return value
+
+    def _refresh_in_background(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        """Запускает фоновое обновление значения, если оно еще не запущено"""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self._load(key, loader)
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления {key}: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        _refresh_executor.submit(refresh)
+
+
+exchange_rates_cache = StaleWhileRevalidateCache()
+stock_prices_cache = StaleWhileRevalidateCache()
+
+
+def get_exchange_rates_swr(max_stale: Optional[float] = None) -> tuple[Optional[list[dict]], Optional[float]]:
+    """Возвращает последние известные курсы валют и их возраст в секундах, обновляя устаревшие в фоне"""
+    return exchange_rates_cache.get("exchange_rates", get_exchange_rates, max_stale)
+
+
+def get_stock_prices_swr(
+    api_key: str, settings_file: str, date: str, max_stale: Optional[float] = None
+) -> tuple[list[dict], Optional[float]]:
+    """Возвращает последние известные цены акций на дату и их возраст в секундах, обновляя устаревшие в фоне"""
+    return stock_prices_cache.get(
+        (settings_file, date[:10]), lambda: get_stock_prices(api_key, settings_file, date), max_stale
+    )
@@ -1,12 +1,20 @@
 import json
 import logging
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
+from typing import Any, Iterable, Optional, Union
 
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
 
-from src.utils import get_exchange_rates, get_stock_prices
+from src.storage import TransactionStore
+from src.top_n import IncrementalTopN, top_n_report
+from src.transactions import TransactionFrame
+from src.utils import get_exchange_rates, get_exchange_rates_swr, get_stock_prices, get_stock_prices_swr
 
 load_dotenv()
 
@@ -23,6 +31,12 @@ file_handler.setLevel(logging.DEBUG)
 file_handler.setFormatter(formatter)
 logger.addHandler(file_handler)
 
+# Общее время ожидания ответа main_first в секундах
+MAIN_FIRST_DEADLINE = 15.0
+
+# Сколько секунд от начала main_first ждать каждую сетевую секцию
+SECTION_TIMEOUTS = {"currency_rates": 5.0, "stock_prices": 10.0}
+
 
 def get_greeting(date_time_str: str) -> str:
     """Функция приветствия в зависимости от времени суток"""
@@ -44,9 +58,19 @@ def get_greeting(date_time_str: str) -> str:
 #     print(greeting)
 
 
-def analyze_transactions(df: pd.DataFrame, date_time_str: str) -> str:
+def analyze_transactions(
+    df: Union[pd.DataFrame, TransactionFrame, TransactionStore], date_time_str: str, per_card: bool = False
+) -> str:
     """Анализирует транзакции из DataFrame и возвращает JSON-ответ"""
     try:
+        if isinstance(df, TransactionStore):
+            return _analyze_rollups(df, per_card)
+
+        # Нормализованные данные уже содержат разобранные суммы и номера карт
+        normalized = isinstance(df, TransactionFrame)
+        if isinstance(df, TransactionFrame):
+            df = df.data
+
         # Проверка, что DataFrame не пустой
         if df.empty:
             logger.error("Нет данных для анализа.")
@@ -60,26 +84,150 @@ def analyze_transactions(df: pd.DataFrame, date_time_str: str) -> str:
             logger.error("Необходимые колонки отсутствуют в данных.")
             return json.dumps({"error": "Необходимые колонки отсутствуют в данных"}, ensure_ascii=False)
 
-        # Последние 4 цифры номера карты
-        if "Номер карты" in df.columns and not df.empty:
-            last_digits = df["Номер карты"].astype(str).str[-4:].mode().iloc[0]  # Наиболее частые последние 4 цифры
+        if normalized:
+            last_digits = _most_common_last_digits(df["Номер карты"])
+            amounts = df["Сумма операции"]
         else:
-            last_digits = ""
+            # Последние 4 цифры номера карты
+            last_digits = df["Номер карты"].astype(str).str[-4:].mode().iloc[0]  # Наиболее частые последние 4 цифры
+            df["Сумма операции"] = pd.to_numeric(df["Сумма операции"], errors="coerce")
+            amounts = df["Сумма операции"]
 
         # Общая сумма расходов
-        df["Сумма операции"] = pd.to_numeric(df["Сумма операции"], errors="coerce")
-        total_spent = abs(df[df["Сумма операции"] < 0]["Сумма операции"].sum())
+        total_spent = abs(amounts[amounts < 0].sum())
 
-        # Вычисление кэшбэка
-        cashback = total_spent / 100.0  # 1 рубль на каждые 100 рублей потраченных
+        result = _cards_analysis(last_digits, total_spent)
+        if per_card:
+            result["per_card"] = _per_card_analysis(df["Номер карты"], amounts)
 
-        result = {
-            "last_digits": last_digits,
-            "total_spent": round(float(total_spent), 2),
-            "cashback": round(cashback, 2),
+        logger.info("Анализ транзакций завершен успешно.")
+        return json.dumps(result, ensure_ascii=False, indent=4)
+
+    except Exception as e:
+        logger.error(f"Ошибка при анализе транзакций: {str(e)}")
+        return json.dumps({"error": str(e)}, ensure_ascii=False)
+
+
+def _analyze_rollups(store: TransactionStore, per_card: bool = False) -> str:
+    """Анализирует транзакции хранилища по готовым агрегатам, не читая сами транзакции"""
+    by_card = store.rollup(group_by="card")
+    if by_card.empty:
+        logger.error("Нет данных для анализа.")
+        return json.dumps({"error": "Нет данных для анализа"}, ensure_ascii=False)
+
+    counts = pd.Series(by_card["operations"].to_numpy(), index=pd.Index(by_card["card"]))
+    result = _cards_analysis(_last_digits_from_counts(counts), by_card["spent"].sum())
+    if per_card:
+        by_card = by_card.dropna(subset=["card"])
+        result["per_card"] = _card_records(
+            by_card["card"].astype(str),
+            by_card["spent"].to_numpy(dtype="float64"),
+            by_card["income"].to_numpy(dtype="float64"),
+            by_card["operations"].to_numpy(dtype="int64"),
+        )
+
+    logger.info("Анализ транзакций по агрегатам завершен успешно.")
+    return json.dumps(result, ensure_ascii=False, indent=4)
+
+
+def _per_card_analysis(cards: pd.Series, amounts: pd.Series) -> list[dict]:
+    """Считает расходы, доходы, кэшбэк и число операций каждой карты за один проход по кодам карт"""
+    if not isinstance(cards.dtype, pd.CategoricalDtype):
+        # Номера карт разбираются один раз в словарь, строки дальше работают с целочисленными кодами
+        cards = cards.where(cards.isna(), cards.astype(str)).astype("category")
+    codes = cards.cat.codes.to_numpy()
+    values = pd.to_numeric(amounts, errors="coerce").to_numpy(dtype="float64")
+
+    # Строки без номера карты в разбивку не попадают
+    valid = codes >= 0
+    codes = codes[valid]
+    values = np.nan_to_num(values[valid])
+    size = len(cards.cat.categories)
+    spent = np.bincount(codes, weights=np.where(values < 0, -values, 0), minlength=size)
+    income = np.bincount(codes, weights=np.where(values > 0, values, 0), minlength=size)
+    operations = np.bincount(codes, minlength=size)
+
+    used = operations > 0
+    return _card_records(pd.Index(cards.cat.categories.astype(str))[used], spent[used], income[used], operations[used])
+
+
+def _card_records(
+    cards: Union[pd.Index, pd.Series], spent: np.ndarray, income: np.ndarray, operations: np.ndarray
+) -> list[dict]:
+    """Формирует записи по картам, отсортированные по убыванию расходов"""
+    cards = pd.Index(cards)
+    order = np.lexsort((cards.to_numpy(), -spent))
+    last_digits = cards.str[-4:]
+    return [
+        {
+            "card": cards[i],
+            "last_digits": last_digits[i],
+            "total_spent": round(float(spent[i]), 2),
+            "income": round(float(income[i]), 2),
+            # 1 рубль на каждые 100 рублей потраченных, как в общем анализе
+            "cashback": round(float(spent[i]) / 100.0, 2),
+            "operations": int(operations[i]),
         }
+        for i in order
+    ]
 
-        logger.info("Анализ транзакций завершен успешно.")
+
+def _most_common_last_digits(cards: pd.Series) -> str:
+    """Находит наиболее частые последние 4 цифры по номерам карт, не обходя каждую строку"""
+    return _last_digits_from_counts(cards.value_counts(dropna=False))
+
+
+def _last_digits_from_counts(counts: pd.Series) -> str:
+    """Находит наиболее частые последние 4 цифры по числу операций каждой карты"""
+    by_digits = counts.groupby(counts.index.astype(str).str[-4:]).sum()
+    # При равенстве берется меньшее значение, как у mode()
+    return str(min(by_digits[by_digits == by_digits.max()].index))
+
+
+def _cards_analysis(last_digits: str, total_spent: float) -> dict:
+    """Формирует результат анализа карт по сумме расходов"""
+    # Вычисление кэшбэка
+    cashback = total_spent / 100.0  # 1 рубль на каждые 100 рублей потраченных
+
+    return {
+        "last_digits": last_digits,
+        "total_spent": round(float(total_spent), 2),
+        "cashback": round(cashback, 2),
+    }
+
+
+def analyze_transactions_chunks(chunks: Iterable[pd.DataFrame], date_time_str: str) -> str:
+    """Анализирует транзакции, поступающие частями, не загружая весь файл в память"""
+    try:
+        logger.info("Начинаем потоковый анализ транзакций.")
+
+        card_counts = pd.Series(dtype="float64")
+        total_spent = 0.0
+        rows_count = 0
+
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+
+            if not all(col in chunk.columns for col in ["Номер карты", "Сумма операции"]):
+                logger.error("Необходимые колонки отсутствуют в данных.")
+                return json.dumps({"error": "Необходимые колонки отсутствуют в данных"}, ensure_ascii=False)
+
+            # В памяти держим только счетчики по картам и текущую сумму
+            rows_count += len(chunk)
+            card_counts = card_counts.add(chunk["Номер карты"].astype(str).str[-4:].value_counts(), fill_value=0)
+            amounts = pd.to_numeric(chunk["Сумма операции"], errors="coerce")
+            total_spent += abs(amounts[amounts < 0].sum())
+
+        if rows_count == 0:
+            logger.error("Нет данных для анализа.")
+            return json.dumps({"error": "Нет данных для анализа"}, ensure_ascii=False)
+
+        # Наиболее частые последние 4 цифры, при равенстве берется меньшее значение, как у mode()
+        last_digits = min(card_counts[card_counts == card_counts.max()].index)
+        result = _cards_analysis(last_digits, total_spent)
+
+        logger.info(f"Потоковый анализ завершен, обработано {rows_count} строк.")
         return json.dumps(result, ensure_ascii=False, indent=4)
 
     except Exception as e:
@@ -87,8 +235,13 @@ def analyze_transactions(df: pd.DataFrame, date_time_str: str) -> str:
         return json.dumps({"error": str(e)}, ensure_ascii=False)
 
 
-def get_top_transactions(df: pd.DataFrame, date_time_str: str) -> str:
-    """Возвращает топ-5 транзакций по сумме платежа в формате JSON от начала месяца до указанной даты"""
+def get_top_transactions(
+    df: Union[pd.DataFrame, TransactionFrame, TransactionStore, IncrementalTopN],
+    date_time_str: str,
+    n: int = 5,
+    group_by: Iterable[str] = (),
+) -> str:
+    """Возвращает топ-n транзакций по сумме платежа в формате JSON от начала месяца до указанной даты"""
     try:
         # Определение начала месяца
         now = datetime.strptime(date_time_str, "%Y-%m-%d %H:%M:%S")
@@ -98,72 +251,124 @@ def get_top_transactions(df: pd.DataFrame, date_time_str: str) -> str:
         logger.debug(f"Начало месяца: {start_of_month}")
         logger.debug(f"Конец диапазона: {end_date}")
 
-        # Преобразование столбца даты в datetime
-        date_format = "%Y-%m-%d %H:%M:%S"  # Убедитесь, что формат совпадает с вашим DataFrame
-        df["Дата операции"] = pd.to_datetime(df["Дата операции"], format=date_format, errors="coerce")
+        if isinstance(df, IncrementalTopN):
+            # Топ месяца поддерживается по мере поступления операций, на текущий момент пересчитывать ничего не нужно
+            top_transactions = df.top(month=now.strftime("%Y-%m"), end=end_date, n=n)
+            logger.info(f"Топ-{n} транзакций получены из инкрементального топа.")
+            return json.dumps({"top_transactions": top_transactions}, ensure_ascii=False, indent=4)
+
+        if isinstance(df, TransactionStore):
+            # Диапазон дат выбирается в хранилище по индексу
+            filtered_df = df.query(start_of_month, end_date).data
+        elif isinstance(df, TransactionFrame):
+            # Даты уже разобраны при загрузке, диапазон выбирается по отсортированному индексу дат
+            filtered_df = df.between(start_of_month, end_date)
+        else:
+            # Преобразование столбца даты в datetime
+            date_format = "%Y-%m-%d %H:%M:%S"  # Убедитесь, что формат совпадает с вашим DataFrame
+            df["Дата операции"] = pd.to_datetime(df["Дата операции"], format=date_format, errors="coerce")
 
-        logger.debug(f"Данные после преобразования даты:\n{df.head()}")
+            logger.debug(f"Данные после преобразования даты:\n{df.head()}")
 
-        # Фильтрация транзакций по дате
-        filtered_df = df[(df["Дата операции"] >= start_of_month) & (df["Дата операции"] <= end_date)]
+            # Фильтрация транзакций по дате
+            filtered_df = df[(df["Дата операции"] >= start_of_month) & (df["Дата операции"] <= end_date)]
 
         logger.debug(f"Отфильтрованные данные:\n{filtered_df.head()}")
 
-        # Сортировка транзакций по сумме в убывающем порядке и выбор топ-5
-        sorted_df = filtered_df.sort_values(by="Сумма операции", ascending=False)
-        top_transactions = sorted_df.head(5)
-
-        logger.debug(f"Топ-5 транзакций:\n{top_transactions}")
+        # Топ выбирается без сортировки всех строк, записи формируются по колонкам
+        result = top_n_report(filtered_df, n, group_by)
 
-        # Форматирование даты и суммы
-        top_transactions.loc[:, "Дата операции"] = top_transactions["Дата операции"].dt.strftime("%d.%m.%Y")
-        top_transactions.loc[:, "Сумма операции"] = top_transactions["Сумма операции"].astype(float)
+        logger.debug(f"Топ-{n} транзакций:\n{result['top_transactions']}")
 
-        # Формирование результата в требуемом формате
-        result = []
-        for _, row in top_transactions.iterrows():
-            result.append(
-                {
-                    "date": row["Дата операции"],
-                    "amount": float(row["Сумма операции"]),
-                    "category": row.get("Категория"),
-                    "description": row.get("Описание"),
-                }
-            )
-
-        logger.info("Топ-5 транзакций успешно получены.")
-        return json.dumps({"top_transactions": result}, ensure_ascii=False, indent=4)
+        logger.info(f"Топ-{n} транзакций успешно получены.")
+        return json.dumps(result, ensure_ascii=False, indent=4)
 
     except Exception as e:
-        logger.error(f"Ошибка при получении топ-5 транзакций: {str(e)}")
+        logger.error(f"Ошибка при получении топ-{n} транзакций: {str(e)}")
         return json.dumps({"error": str(e)}, ensure_ascii=False)
 
 
-def main_first(df: pd.DataFrame, date_time_str: str) -> str:
+def _section_result(name: str, future: Future, timeout: float) -> list:
+    """Ждет результат сетевой секции не дольше timeout, при ошибке или таймауте возвращает пустой список"""
+    try:
+        return future.result(timeout=max(timeout, 0)) or []
+    except FutureTimeoutError:
+        future.cancel()
+        logger.warning(f"Секция {name} не успела за {timeout:.1f} с, ответ будет без нее")
+    except Exception as e:
+        logger.error(f"Ошибка в секции {name}: {str(e)}")
+    return []
+
+
+def main_first(
+    df: Union[pd.DataFrame, TransactionFrame, TransactionStore],
+    date_time_str: str,
+    deadline: float = MAIN_FIRST_DEADLINE,
+    section_timeouts: Optional[dict[str, float]] = None,
+    stale_while_revalidate: bool = False,
+    max_stale: Optional[float] = None,
+) -> str:
     """Главная функция, которая возвращает JSON-ответ с необходимыми параметрами"""
     try:
+        started = time.monotonic()
+        timeouts = {**SECTION_TIMEOUTS, **(section_timeouts or {})}
+
+        # Сетевые запросы запускаются первыми и выполняются параллельно с локальной аналитикой
+        stock_params: dict[str, Any] = {
+            "api_key": os.getenv("alphavantage_co_API_KEY"),
+            "settings_file": "../user_settings.json",
+            "date": date_time_str,
+        }
+        # У каждого вызова свой пул: секция, брошенная по таймауту, занимает только свой поток и не задерживает
+        # сетевые запросы следующих вызовов
+        network_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="main_first")
+        futures: dict[str, Future]
+        if stale_while_revalidate:
+            # Последние известные значения отдаются сразу вместе с возрастом, обновление идет в фоне
+            futures = {
+                "currency_rates": network_executor.submit(get_exchange_rates_swr, max_stale),
+                "stock_prices": network_executor.submit(get_stock_prices_swr, **stock_params, max_stale=max_stale),
+            }
+        else:
+            futures = {
+                "currency_rates": network_executor.submit(get_exchange_rates),
+                "stock_prices": network_executor.submit(get_stock_prices, **stock_params),
+            }
+        # Пул закрывается без ожидания: незавершенные секции дорабатывают в своих потоках
+        network_executor.shutdown(wait=False)
+
         # Получение данных
         greeting = get_greeting(date_time_str)
         cards_analysis_json = analyze_transactions(df, date_time_str)
         top_transactions_json = get_top_transactions(df, date_time_str)
-        exchange_rates = get_exchange_rates()
-        stock_prices = get_stock_prices(
-            api_key=os.getenv("alphavantage_co_API_KEY"), settings_file="../user_settings.json", date=date_time_str
-        )
 
         # Декодирование JSON-ответов в словари
         cards_analysis = json.loads(cards_analysis_json)
         top_transactions = json.loads(top_transactions_json)
 
+        # Сетевые секции ждутся до своего таймаута, но не дольше общего дедлайна
+        sections = {}
+        data_age = {}
+        for name, future in futures.items():
+            elapsed = time.monotonic() - started
+            sections[name] = _section_result(name, future, min(timeouts[name], deadline) - elapsed)
+            if stale_while_revalidate:
+                value, age = sections[name] or ([], None)
+                sections[name] = value or []
+                data_age[name] = None if age is None else round(age, 1)
+
         # Формирование результата в формате JSON
         result = {
             "greeting": greeting,
             "cards": cards_analysis,
             "top_transactions": top_transactions.get("top_transactions", []),
-            "currency_rates": exchange_rates if exchange_rates else [],
-            "stock_prices": stock_prices if stock_prices else [],
+            "currency_rates": sections["currency_rates"],
+            "stock_prices": sections["stock_prices"],
         }
+        if stale_while_revalidate:
+            result["data_age"] = data_age
 
+        logger.info(f"Ответ main_first собран за {time.monotonic() - started:.3f} с")
         return json.dumps(result, ensure_ascii=False, indent=4)
 
     except Exception as e:
@@ -0,0 +1,130 @@
+import json
+
+import pandas as pd
+import pytest
+import requests_mock
+
+from src import currency
+from src.currency import ORIGINAL_AMOUNT_COLUMN, convert_to_rub, get_historical_rates
+from src.storage import TransactionStore
+from src.views import analyze_transactions
+
+
+@pytest.fixture(autouse=True)
+def fx_cache_path(monkeypatch, tmp_path):
+    """Кэш курсов каждого теста лежит во временном каталоге"""
+    monkeypatch.setattr(currency, "FX_CACHE_PATH", str(tmp_path / "fx_rates.json"))
+    monkeypatch.setenv("API_KEY", "fake_api_key")
+
+
+@pytest.fixture
+def transactions():
+    return pd.DataFrame(
+        {
+            "Дата операции": [
+                "01.07.2024 10:00:00",
+                "02.07.2024 11:00:00",
+                "06.07.2024 12:00:00",
+                "03.07.2024 09:00:00",
+                "20.06.2024 09:00:00",
+            ],
+            "Номер карты": ["*7197", "*7197", "*7197", "*5091", "*5091"],
+            "Сумма операции": [-1000.0, -10.0, -20.0, -5.0, -7.0],
+            "Валюта операции": ["RUB", "USD", "USD", "EUR", "EUR"],
+            "Сумма платежа": [-1000.0, -900.0, -1800.0, -480.0, -650.0],
+            "Валюта платежа": ["RUB", "RUB", "RUB", "RUB", "RUB"],
+            "Категория": ["Супермаркеты"] * 5,
+        }
+    )
+
+
+@pytest.fixture
+def rates():
+    return pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2024-07-01", "2024-07-02", "2024-07-05", "2024-07-01"]),
+            "currency": ["USD", "USD", "USD", "EUR"],
+            "rate": [0.0125, 0.01, 0.0125, 0.01],
+        }
+    )
+
+
+def test_convert_to_rub(transactions, rates):
+    """Каждая операция пересчитывается по своему курсу, выходные берут последний известный курс"""
+    data = convert_to_rub(transactions, rates).data
+
+    assert data["Сумма операции"].tolist() == pytest.approx([-1000.0, -1000.0, -1600.0, -500.0, -650.0])
+    assert data[ORIGINAL_AMOUNT_COLUMN].tolist() == [-1000.0, -10.0, -20.0, -5.0, -7.0]
+    # Исходные данные не изменяются
+    assert transactions["Сумма операции"].tolist()[1] == -10.0
+
+
+def test_convert_to_rub_totals(transactions, rates):
+    result = json.loads(analyze_transactions(convert_to_rub(transactions, rates), "2024-07-15 12:00:00"))
+
+    assert result["total_spent"] == pytest.approx(4750.0)
+
+
+def test_store_keeps_rub_amounts(monkeypatch, tmp_path, transactions, rates):
+    """Хранилище пересчитывает суммы при добавлении, поэтому агрегаты складываются в рублях"""
+    monkeypatch.setattr(currency, "get_historical_rates", lambda *args: rates)
+
+    with TransactionStore(str(tmp_path / "transactions.db")) as store:
+        assert store.append(transactions) == 5
+        # Повторная загрузка распознается по исходной сумме
+        assert store.append(transactions) == 0
+
+        data = store.to_frame().data
+        result = json.loads(analyze_transactions(store, "2024-07-15 12:00:00"))
+
+    assert data["Сумма операции"].tolist() == pytest.approx([-1000.0, -1000.0, -1600.0, -500.0, -650.0])
+    assert data[ORIGINAL_AMOUNT_COLUMN].tolist() == [-1000.0, -10.0, -20.0, -5.0, -7.0]
+    assert result["total_spent"] == pytest.approx(4750.0)
+
+
+def test_get_historical_rates_cached():
+    """Курсы загружаются одним запросом за период и затем берутся из кэша"""
+    with requests_mock.Mocker() as m:
+        m.get(
+            "https://api.apilayer.com/exchangerates_data/timeseries",
+            json={"rates": {"2024-07-01": {"USD": 0.0125, "EUR": 0.01}, "2024-07-02": {"USD": 0.01, "EUR": 0.01}}},
+        )
+
+        first = get_historical_rates(["USD", "EUR", "RUB"], "2024-07-01", "2024-07-02")
+        second = get_historical_rates(["USD"], "2024-07-01", "2024-07-02")
+
+        assert m.call_count == 1
+        assert m.request_history[0].qs["symbols"] == ["eur,usd"]
+
+    assert len(first) == 4
+    assert second["rate"].tolist() == [0.0125, 0.01]
+
+
+def test_get_historical_rates_fetches_only_missing_edges(mocker):
+    """Продление периода на день загружает только этот день, а не всю историю заново"""
+    currency._save_fx_cache(
+        {
+            "rates": {"2023-12-29": {"USD": 0.011, "EUR": 0.01}},
+            "covered": {"USD": ["2021-01-01", "2023-12-31"], "EUR": ["2022-01-01", "2023-12-31"]},
+        }
+    )
+    fetch = mocker.patch.object(
+        currency, "_fetch_timeseries", return_value={"2024-01-01": {"USD": 0.0111, "EUR": 0.0101}}
+    )
+
+    rates = get_historical_rates(["USD", "EUR"], "2021-06-01", "2024-01-01")
+
+    assert fetch.call_count == 2
+    assert sorted(call.args[:3] for call in fetch.call_args_list) == [
+        (["EUR"], "2021-06-01", "2021-12-31"),
+        (["EUR", "USD"], "2024-01-01", "2024-01-01"),
+    ]
+    assert currency._load_fx_cache()["covered"] == {
+        "USD": ["2021-01-01", "2024-01-01"],
+        "EUR": ["2021-06-01", "2024-01-01"],
+    }
+    assert len(rates) == 4
+
+    # Период уже загружен целиком, запросов больше нет
+    get_historical_rates(["USD", "EUR"], "2022-01-01", "2024-01-01")
+    assert fetch.call_count == 2
@@ -1,11 +1,11 @@
 import json
-import os
 from unittest.mock import patch
 
 import pandas as pd
 import pytest
 
 from src.main import main
+from src.reports import wait_for_report_writes
 
 
 # Фикстура для создания тестовых данных
@@ -45,23 +45,39 @@ def test_main(
 ):
 
     with patch("src.main.search_transactions") as mock_search_transactions, patch(
-        "src.main.spending_by_category"
+        "src.main.build_spending_by_category"
     ) as mock_spending_by_category, patch("src.main.main_first") as mock_main_first:
 
         mock_search_transactions.return_value = expected_search_results
-        mock_spending_by_category.return_value = "test_report.json"
+        # Отчет строится функцией без декоратора и возвращается как DataFrame, без записи в файл
+        mock_spending_by_category.return_value = pd.DataFrame(expected_spending_by_category)
         mock_main_first.return_value = json.dumps(expected_main_first)
 
-        # Создание файла отчета
-        report_data = expected_spending_by_category
-        report_file_name = "test_report.json"
-        with open(report_file_name, "w", encoding="utf-8") as f:
-            json.dump(report_data, f)
-
         result = main(sample_transactions, "2021-12-01 00:00:00", search_query=search_query, category=category)
 
         assert result["search_transactions"] == expected_search_results
         assert result["spending_by_category"] == expected_spending_by_category
         assert result["main_first"] == expected_main_first
+        assert mock_spending_by_category.called == bool(category)
+
+
+def test_main_report_file(tmp_path):
+    """Отчет по категории возвращается сразу, а файл записывается в фоне по желанию"""
+    transactions = pd.DataFrame(
+        {
+            "Дата операции": ["01.12.2021 12:00:00", "02.12.2021 13:00:00"],
+            "Сумма операции": [-100.0, -200.0],
+            "Категория": ["Супермаркеты", "Рестораны"],
+        }
+    )
+    report_file = str(tmp_path / "report.json")
+
+    with patch("src.main.main_first", return_value="{}"):
+        result = main(transactions, "2021-12-05 00:00:00", category="Супермаркеты", report_file=report_file)
+    wait_for_report_writes()
 
-        os.remove(report_file_name)
+    assert result["spending_by_category"] == [
+        {"Дата операции": "2021.12.01 12:00:00", "Сумма операции": -100.0, "Категория": "Супермаркеты"}
+    ]
+    with open(report_file, encoding="utf-8") as f:
+        assert json.load(f) == result["spending_by_category"]
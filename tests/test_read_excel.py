@@ -4,7 +4,8 @@ import tempfile
 import pandas as pd
 import pytest
 
-from src.read_excel import read_excel_file
+from src.read_excel import (get_excel_cache_stats, invalidate_excel_cache, read_excel_cached, read_excel_chunks,
+                            read_excel_file, reset_excel_cache_stats)
 
 
 @pytest.fixture
@@ -45,3 +46,106 @@ def test_read_excel_file_failure():
     non_existent_file = "non_existent_file.xlsx"
     with pytest.raises(RuntimeError, match=f"Ошибка при чтении файла {non_existent_file}:"):
         read_excel_file(non_existent_file)
+
+
+@pytest.fixture(params=["parquet", "pickle"])
+def cache_format(request):
+    """Формат файла-кэша; parquet проверяется только при установленном pyarrow"""
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
+def test_read_excel_cached_hit_and_miss(temp_excel_file, tmp_path, cache_format):
+    """Первое чтение разбирает xlsx, второе берет данные из кэша"""
+    reset_excel_cache_stats()
+    first = read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format=cache_format)
+    second = read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format=cache_format)
+
+    pd.testing.assert_frame_equal(first, second)
+    stats = get_excel_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+    assert stats["bytes_loaded"] > 0
+
+
+def test_read_excel_cached_detects_changes(temp_excel_file, tmp_path, cache_format):
+    """Измененный файл перечитывается, а не берется из кэша"""
+    reset_excel_cache_stats()
+    read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format=cache_format)
+
+    pd.DataFrame({"Сумма операции": [1.0, 2.0, 3.0]}).to_excel(temp_excel_file, index=False)
+    result = read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format=cache_format)
+
+    assert list(result["Сумма операции"]) == [1.0, 2.0, 3.0]
+    assert get_excel_cache_stats()["misses"] == 2
+
+
+def test_invalidate_excel_cache(temp_excel_file, tmp_path, cache_format):
+    """Инвалидация удаляет кэш, следующее чтение снова разбирает файл"""
+    reset_excel_cache_stats()
+    read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format=cache_format)
+
+    assert invalidate_excel_cache(temp_excel_file, cache_dir=str(tmp_path)) is True
+    assert invalidate_excel_cache(temp_excel_file, cache_dir=str(tmp_path)) is False
+    assert list(tmp_path.iterdir()) == []
+
+    read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format=cache_format)
+    assert get_excel_cache_stats() == {"hits": 0, "misses": 2, "bytes_loaded": 0}
+
+
+def test_read_excel_cached_defaults_to_parquet(temp_excel_file, tmp_path):
+    """По умолчанию кэш пишется в parquet, pickle-файл не создается"""
+    pytest.importorskip("pyarrow")
+    read_excel_cached(temp_excel_file, cache_dir=str(tmp_path))
+
+    names = sorted(path.name for path in tmp_path.iterdir())
+    base_name = os.path.basename(temp_excel_file)
+    assert names == [f".{base_name}.cache.json", f".{base_name}.cache.parquet"]
+
+
+def test_read_excel_cached_without_pyarrow(temp_excel_file, tmp_path, mocker):
+    """Без pyarrow и без явного формата файл читается напрямую, кэш не создается"""
+    mocker.patch("src.read_excel.importlib.util.find_spec", return_value=None)
+    reset_excel_cache_stats()
+
+    result = read_excel_cached(temp_excel_file, cache_dir=str(tmp_path))
+
+    pd.testing.assert_frame_equal(result, pd.read_excel(temp_excel_file))
+    assert list(tmp_path.iterdir()) == []
+    assert get_excel_cache_stats() == {"hits": 0, "misses": 0, "bytes_loaded": 0}
+
+
+def test_read_excel_cached_ignores_other_format(temp_excel_file, tmp_path):
+    """Кэш другого формата не используется: pickle не загружается, если запрошен parquet"""
+    pytest.importorskip("pyarrow")
+    reset_excel_cache_stats()
+    read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format="pickle")
+    read_excel_cached(temp_excel_file, cache_dir=str(tmp_path), cache_format="parquet")
+
+    assert get_excel_cache_stats()["misses"] == 2
+
+
+def test_read_excel_cached_unknown_format(temp_excel_file):
+    """Неизвестный формат кэша"""
+    with pytest.raises(ValueError, match="Неизвестный формат кэша"):
+        read_excel_cached(temp_excel_file, cache_format="csv")
+
+
+def test_read_excel_chunks(temp_excel_file):
+    """Потоковое чтение отдает части заданного размера с числовыми суммами"""
+    chunks = list(read_excel_chunks(temp_excel_file, chunk_size=1))
+
+    assert len(chunks) == 2
+    assert all(len(chunk) == 1 for chunk in chunks)
+    assert chunks[0]["Сумма операции"].dtype == "float64"
+
+    result = pd.concat(chunks, ignore_index=True)
+    assert list(result["Сумма операции"]) == [-1500.0, 500.0]
+    assert list(result["Номер карты"].astype(str)) == ["1234567812345678", "8765432187654321"]
+
+
+def test_read_excel_chunks_failure():
+    """Ошибка открытия файла при потоковом чтении"""
+    with pytest.raises(RuntimeError, match="Ошибка при чтении файла non_existent_file.xlsx:"):
+        list(read_excel_chunks("non_existent_file.xlsx"))
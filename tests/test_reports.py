@@ -1,10 +1,14 @@
 import json
 import os
+import tempfile
 import unittest
 
+import numpy as np
 import pandas as pd
 
-from src.reports import report_to_file, spending_by_category
+from src.reports import (ReportHandle, report_to_file, spending_by_categories, spending_by_category,
+                         spending_by_category_chunks, spending_trend, write_report)
+from src.transactions import TransactionFrame, to_plain_frame
 
 
 class TestSpendingByCategory(unittest.TestCase):
@@ -36,6 +40,42 @@ class TestSpendingByCategory(unittest.TestCase):
         # Проверим, что результат не пустой и содержит ожидаемые значения
         self.assertGreater(len(json.loads(result)), 0)
 
+    def test_spending_by_category_transaction_frame(self):
+        """Нормализованные данные не разбираются повторно и дают тот же отчет"""
+        frame = TransactionFrame.from_raw(self.df)
+
+        result = spending_by_category(frame, "супермаркеты", "2024-07-15 00:00:00")
+        expected = spending_by_category(self.df.copy(), "Супермаркеты", "2024-07-15 00:00:00")
+
+        self.assertEqual(json.loads(result), json.loads(expected))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(frame.data["Дата операции"]))
+
+    def test_spending_by_category_chunks(self):
+        """Потоковая версия отчета совпадает с обычной"""
+        chunks = [self.df.iloc[:2].copy(), self.df.iloc[2:].copy()]
+
+        result = spending_by_category_chunks(chunks, "Супермаркеты", "2024-07-15 00:00:00")
+        expected = spending_by_category(self.df.copy(), "Супермаркеты", "2024-07-15 00:00:00")
+
+        self.assertEqual(json.loads(result), json.loads(expected))
+        self.assertEqual(len(json.loads(result)), 2)
+
+    def test_spending_by_category_chunks_export_dates(self):
+        """Даты в формате выгрузки (с временем) разбираются в каждой части"""
+        df = pd.DataFrame(
+            {
+                "Дата операции": ["31.12.2021 16:44:00", "30.12.2021 10:00:00", "29.12.2021 12:00:00"],
+                "Категория": ["Супермаркеты", "Супермаркеты", "Кафе"],
+                "Сумма операции": [-160.89, -64.0, -300.0],
+            }
+        )
+        chunks = [df.iloc[:1].copy(), df.iloc[1:].copy()]
+
+        result = json.loads(spending_by_category_chunks(chunks, "Супермаркеты", "2022-01-01 00:00:00"))
+
+        self.assertEqual([row["Дата операции"] for row in result], ["2021.12.31 16:44:00", "2021.12.30 10:00:00"])
+        self.assertEqual([row["Сумма операции"] for row in result], [-160.89, -64.0])
+
     def test_decorator_creates_file(self):
         """Проверка, что декоратор создает файл"""
 
@@ -50,6 +90,12 @@ class TestSpendingByCategory(unittest.TestCase):
         # Очистка после теста
         os.remove("test_report.json")
 
+    def tearDown(self):
+        """Удаление отчетов, созданных декоратором по умолчанию"""
+        for file in os.listdir():
+            if file.startswith("report_spending_by_category") and file.endswith(".json"):
+                os.remove(file)
+
     def test_decorator_with_default_filename(self):
         """Проверка, что декоратор создает файл с именем по умолчанию"""
 
@@ -67,3 +113,188 @@ class TestSpendingByCategory(unittest.TestCase):
         # Очистка после теста
         for file in files:
             os.remove(file)
+
+
+class TestReportFormats(unittest.TestCase):
+
+    def setUp(self):
+        """Типизированные данные отчета и временный каталог для файлов"""
+        self.df = TransactionFrame.from_raw(
+            pd.DataFrame(
+                {
+                    "Дата операции": ["01.07.2024 10:00:00", "10.07.2024 12:00:00"],
+                    "Категория": ["Супермаркеты", "Кафе"],
+                    "Сумма операции": [-1500.5, -800.0],
+                    "MCC": [5411, None],
+                }
+            )
+        ).data
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.expected = json.dumps(
+            to_plain_frame(self.df, "%Y-%m-%d").to_dict(orient="records"), ensure_ascii=False, indent=4
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    def test_default_json_matches_previous_output(self):
+        """Потоковая запись по умолчанию дает тот же JSON, что и json.dumps всего списка"""
+
+        @report_to_file(file_name=self.path("report.json"))
+        def dummy_function():
+            return self.df
+
+        self.assertEqual(dummy_function(), self.expected)
+        with open(self.path("report.json"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.expected)
+
+    def test_streaming_formats(self):
+        for output_format in ["json_compact", "ndjson", "csv"]:
+            path = self.path(f"report.{output_format}")
+            self.assertEqual(write_report(self.df, path, output_format), 2)
+            handle = ReportHandle(path, output_format, 2)
+            records = handle.to_frame().to_dict(orient="records")
+            self.assertEqual(records[0]["Категория"], "Супермаркеты")
+            self.assertEqual(records[1]["Сумма операции"], -800.0)
+
+        with open(self.path("report.ndjson"), encoding="utf-8") as f:
+            self.assertEqual([json.loads(line) for line in f], json.loads(self.expected))
+
+    def test_return_handle(self):
+        @report_to_file(file_name=self.path("report.ndjson"), output_format="ndjson", return_handle=True)
+        def dummy_function():
+            return self.df
+
+        handle = dummy_function()
+
+        self.assertIsInstance(handle, ReportHandle)
+        self.assertEqual(handle.rows, 2)
+        self.assertEqual(len(handle.read_text().splitlines()), 2)
+
+    def test_empty_report(self):
+        self.assertEqual(write_report(pd.DataFrame(), self.path("empty.json")), 0)
+        with open(self.path("empty.json"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), "[]")
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            report_to_file(output_format="xml")
+
+
+class TestSpendingByCategories(unittest.TestCase):
+
+    def setUp(self):
+        """Данные с несколькими категориями и датами в разных окнах"""
+        self.frame = TransactionFrame.from_raw(
+            pd.DataFrame(
+                {
+                    "Дата операции": ["01.07.2024", "10.07.2024", "15.07.2024", "20.04.2024", "05.07.2024"],
+                    "Категория": ["Супермаркеты", "Кафе", "Супермаркеты", "Кафе", None],
+                    "Сумма операции": [-1500, -800, -2000, -1200, -100],
+                }
+            )
+        )
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def test_matches_single_category_reports(self):
+        """Каждая категория отчета совпадает с отдельным вызовом spending_by_category"""
+        result = json.loads(spending_by_categories(self.frame, ["супер", "кафе", "такси"], "2024-07-15 00:00:00"))
+
+        for category in ["супер", "кафе"]:
+            expected = json.loads(spending_by_category(self.frame, category, "2024-07-15 00:00:00"))
+            rows = [
+                {key: value for key, value in row.items() if key not in ("Запрос категории", "Окно, дней")}
+                for row in result
+                if row["Запрос категории"] == category
+            ]
+            self.assertEqual(rows, expected)
+        self.assertEqual(len(result), 4)
+
+    def test_windows(self):
+        result = json.loads(
+            spending_by_categories(self.frame, ["супер", "кафе"], "2024-07-15 00:00:00", windows=[7, 90])
+        )
+
+        counts = {}
+        for row in result:
+            key = (row["Запрос категории"], row["Окно, дней"])
+            counts[key] = counts.get(key, 0) + 1
+        self.assertEqual(counts, {("супер", 7): 1, ("кафе", 7): 1, ("супер", 90): 2, ("кафе", 90): 2})
+
+    def test_no_matches(self):
+        self.assertEqual(json.loads(spending_by_categories(self.frame, ["такси"], "2024-07-15 00:00:00")), [])
+        self.assertEqual(json.loads(spending_by_categories(self.frame, ["кафе"], "15-07-2024")), [])
+
+
+class TestSpendingTrend(unittest.TestCase):
+
+    def setUp(self):
+        """Случайные траты за полгода и временный каталог для отчетов"""
+        rng = np.random.default_rng(1)
+        size = 300
+        self.frame = TransactionFrame.from_raw(
+            pd.DataFrame(
+                {
+                    "Дата операции": (
+                        pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 180 * 24, size), unit="h")
+                    ).strftime("%d.%m.%Y %H:%M:%S"),
+                    "Категория": rng.choice(["Супермаркеты", "Кафе", "Такси"], size),
+                    "Сумма операции": rng.integers(-1000, 300, size).astype(float),
+                }
+            )
+        )
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def brute_force(self, category, day_start, day_end):
+        data = self.frame.data
+        days = data["Дата операции"].dt.normalize()
+        mask = (
+            data["Категория"].astype(str).str.contains(category, case=False) & (days >= day_start) & (days <= day_end)
+        )
+        amounts = data.loc[mask, "Сумма операции"]
+        return -amounts[amounts < 0].sum()
+
+    def test_rolling_window_matches_brute_force(self):
+        result = pd.DataFrame(json.loads(spending_trend(self.frame, window=30)))
+
+        for _, row in result.sample(60, random_state=0).iterrows():
+            day = pd.Timestamp(row["Дата"])
+            expected = self.brute_force(row["Категория"], day - pd.Timedelta(days=29), day)
+            self.assertAlmostEqual(row["Траты за окно"], expected, places=2)
+
+    def test_month_aligned_window(self):
+        result = pd.DataFrame(json.loads(spending_trend(self.frame, ["кафе", "такси|кафе"], months=2)))
+
+        self.assertEqual(set(result["Категория"]), {"кафе", "такси|кафе"})
+        for _, row in result.sample(60, random_state=0).iterrows():
+            day = pd.Timestamp(row["Дата"])
+            month_start = (day.to_period("M") - 1).to_timestamp()
+            expected = self.brute_force(row["Категория"], month_start, day)
+            self.assertAlmostEqual(row["Траты за окно"], expected, places=2)
+
+    def test_invalid_window(self):
+        for kwargs in [{"window": 0}, {"window": -3}, {"months": 0}]:
+            with self.assertRaises(ValueError):
+                spending_trend(self.frame, **kwargs)
+
+    def test_end_date(self):
+        result = json.loads(spending_trend(self.frame, ["кафе"], "2024-03-01 00:00:00"))
+
+        self.assertEqual(result[-1]["Дата"], "2024-03-01")
+        first_day = self.frame.data["Дата операции"].min().strftime("%Y-%m-%d")
+        self.assertEqual(result[0]["Дата"], first_day)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.search_index import SearchIndex
+
+
+@pytest.fixture
+def sample_df():
+    return pd.DataFrame(
+        {
+            "Описание": ["Колхоз", "Яндекс Такси", "Магнит у дома", None, "Перевод Ивану", 42],
+            "Категория": pd.Series(["Супермаркеты", "Транспорт", "Супермаркеты", "Кафе", None, "Прочее"]).astype(
+                "category"
+            ),
+        }
+    )
+
+
+def legacy_search(df, query):
+    """Поиск по тому же правилу, что и search_transactions для сырых данных"""
+    query = query.lower()
+    mask = df["Описание"].str.lower().str.contains(query, na=False) | df["Категория"].str.lower().str.contains(
+        query, na=False
+    )
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["колхоз", "КОЛ", "кс", "т", "такси", "декс так", "маркет", "у дома", " ", "", "нет такого", "м.г", "42"],
+)
+def test_search_matches_substring_semantics(sample_df, query):
+    index = SearchIndex(sample_df)
+    assert index.search(query).tolist() == legacy_search(sample_df, query).tolist()
+
+
+def test_search_index_reused_across_queries(sample_df):
+    index = SearchIndex(sample_df)
+
+    assert index.search("супер").tolist() == [0, 2]
+    assert index.search("Такси").tolist() == [1]
+    assert index.search("кафе").tolist() == [3]
@@ -1,8 +1,10 @@
 import json
 
+import pandas as pd
 import pytest
 
-from src.services import search_transactions
+from src.services import search_transactions, search_transactions_batch
+from src.transactions import TransactionFrame
 
 
 @pytest.fixture
@@ -80,6 +82,18 @@ def test_search_transactions(sample_transactions):
     assert result == expected_json
 
 
+def test_search_transactions_transaction_frame(sample_transactions):
+    """Поиск по нормализованным данным возвращает даты в исходном формате"""
+    frame = TransactionFrame.from_raw(pd.DataFrame(sample_transactions))
+
+    result = json.loads(search_transactions(frame, "колхоз"))
+
+    assert len(result) == 2
+    assert result[0]["Дата операции"] == "31.12.2021 16:44:00"
+    assert result[0]["Сумма операции"] == -160.89
+    assert result[0]["MCC"] == "5411"
+
+
 def test_search_transactions_no_results(sample_transactions):
     """Тестирование поиска транзакций без результатов"""
     search_query = "Не существует"
@@ -114,3 +128,39 @@ def test_search_transactions_missing_columns():
     result = search_transactions(transactions, search_query)
 
     assert result == expected_json
+
+
+def test_search_transactions_batch(sample_transactions):
+    """Пакетный поиск возвращает строки и количество для каждого запроса"""
+    sample_transactions[1]["Описание"] = "Магнит"
+    queries = ["колхоз", "МАГНИТ", "супер", "нет такого"]
+
+    result = json.loads(search_transactions_batch(sample_transactions, queries))
+
+    assert result == {
+        "колхоз": {"count": 1, "rows": [0]},
+        "МАГНИТ": {"count": 1, "rows": [1]},
+        "супер": {"count": 2, "rows": [0, 1]},
+        "нет такого": {"count": 0, "rows": []},
+    }
+
+
+def test_search_transactions_batch_counts_only(sample_transactions):
+    frame = TransactionFrame.from_raw(pd.DataFrame(sample_transactions))
+
+    result = json.loads(search_transactions_batch(frame, ["колхоз", "5411"], counts_only=True))
+
+    assert result == {"колхоз": 2, "5411": 0}
+
+
+def test_search_transactions_batch_regex(sample_transactions):
+    """Запрос с метасимволами в пакетном поиске находит те же строки, что и в search_transactions"""
+    sample_transactions[1]["Описание"] = "Магнит"
+    frame = TransactionFrame.from_raw(pd.DataFrame(sample_transactions))
+
+    for transactions in [sample_transactions, frame]:
+        result = json.loads(search_transactions_batch(transactions, ["колхоз|магнит", "колхоз"]))
+        expected = json.loads(search_transactions(transactions, "колхоз|магнит"))
+
+        assert result["колхоз|магнит"]["count"] == len(expected) == 2
+        assert result["колхоз"]["rows"] == [0]
@@ -0,0 +1,150 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src.reports import spending_by_category
+from src.services import search_transactions
+from src.storage import TransactionStore
+from src.transactions import TransactionFrame
+from src.views import analyze_transactions
+
+
+@pytest.fixture
+def statement():
+    """Выписка с повторяющейся операцией и несколькими картами"""
+    return pd.DataFrame(
+        {
+            "Дата операции": [
+                "01.07.2024 10:00:00",
+                "01.07.2024 10:00:00",
+                "10.07.2024 12:00:00",
+                "15.07.2024 09:30:00",
+                "20.04.2024 18:00:00",
+            ],
+            "Номер карты": ["*7197", "*7197", "*5091", "*7197", "*5091"],
+            "Сумма операции": [-150.0, -150.0, -800.0, -2000.0, -1200.0],
+            "Категория": ["Супермаркеты", "Супермаркеты", "Кафе", "Супермаркеты", "Кафе"],
+            "MCC": [5411, 5411, 5812, 5411, 5812],
+            "Описание": ["Колхоз", "Колхоз", "Кофейня", "Магнит", "Кофейня"],
+        }
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    with TransactionStore(str(tmp_path / "transactions.db")) as store:
+        yield store
+
+
+def test_append_deduplicates(store, statement):
+    """Повторная загрузка той же выписки не добавляет строк, одинаковые операции внутри выписки сохраняются"""
+    assert store.append(statement) == 5
+    assert store.append(statement) == 0
+
+    # Следующая выписка пересекается с предыдущей
+    next_statement = pd.concat([statement.iloc[3:], statement.iloc[:1].assign(**{"Описание": "Пятерочка"})])
+    assert store.append(next_statement) == 1
+    assert len(store) == 6
+
+
+def test_query_filters(store, statement):
+    store.append(statement)
+
+    frame = store.query(start=pd.Timestamp("2024-07-01"), end=pd.Timestamp("2024-07-31"), card="*7197")
+
+    assert isinstance(frame, TransactionFrame)
+    assert frame.data["Сумма операции"].tolist() == [-150.0, -150.0, -2000.0]
+    assert str(frame.data["MCC"].dtype) == "Int64"
+    assert store.query(categories=["Кафе"], search="кофе").data["Описание"].tolist() == ["Кофейня", "Кофейня"]
+
+
+def test_search_transactions_pushdown(store, statement):
+    store.append(statement)
+
+    result = json.loads(search_transactions(store, "магнит"))
+
+    assert len(result) == 1
+    assert result[0]["Описание"] == "Магнит"
+    assert result[0]["Дата операции"] == "15.07.2024 09:30:00"
+
+
+def test_search_transactions_pushdown_regex(store, statement):
+    """Запрос с метасимволами находит в хранилище те же строки, что и поиск по TransactionFrame"""
+    store.append(statement)
+
+    result = json.loads(search_transactions(store, "магнит|колхоз"))
+    expected = json.loads(search_transactions(TransactionFrame.from_raw(statement), "магнит|колхоз"))
+
+    assert [row["Описание"] for row in result] == ["Колхоз", "Колхоз", "Магнит"]
+    assert result == expected
+
+
+def test_spending_by_category_pushdown(store, statement):
+    store.append(statement)
+
+    result = spending_by_category(store, "супер", "2024-07-15 12:00:00")
+    expected = spending_by_category(TransactionFrame.from_raw(statement), "супер", "2024-07-15 12:00:00")
+
+    assert json.loads(result) == json.loads(expected)
+    assert len(json.loads(result)) == 3
+
+
+def test_rollups_match_raw_sums(store, statement):
+    """Итоги из агрегатов совпадают с суммами по исходным строкам, в том числе для неполных месяцев"""
+    store.append(statement)
+    store.append(statement)
+    data = TransactionFrame.from_raw(statement).data
+
+    for start, end in [
+        (None, None),
+        ("2024-04-01", "2024-06-30"),
+        ("2024-04-20", "2024-07-10"),
+        ("2024-07-02", "2024-07-15"),
+    ]:
+        dates = data["Дата операции"].dt.normalize()
+        mask = pd.Series(True, index=data.index)
+        if start:
+            mask &= dates >= start
+            mask &= dates <= end
+        amounts = data.loc[mask, "Сумма операции"]
+
+        totals = store.rollup_totals(start, end)
+        assert totals["spent"] == pytest.approx(-amounts[amounts < 0].sum())
+        assert totals["operations"] == int(mask.sum())
+
+    by_category = store.rollup(group_by="category").set_index("category")["spent"].to_dict()
+    assert by_category == pytest.approx({"Кафе": 2000.0, "Супермаркеты": 2300.0})
+
+
+def test_rollups_rebuilt_for_existing_store(tmp_path, statement):
+    path = str(tmp_path / "transactions.db")
+    with TransactionStore(path) as store:
+        store.append(statement)
+        store.connection.execute("DELETE FROM monthly_rollup")
+        store.connection.commit()
+
+    with TransactionStore(path) as store:
+        assert store.rollup_totals()["operations"] == 5
+
+
+def test_analyze_transactions_from_rollups(store, statement):
+    store.append(statement)
+
+    result = json.loads(analyze_transactions(store, "2024-07-15 12:00:00"))
+    expected = json.loads(analyze_transactions(TransactionFrame.from_raw(statement), "2024-07-15 12:00:00"))
+
+    assert result == expected
+    assert result == {"last_digits": "7197", "total_spent": 4300.0, "cashback": 43.0}
+
+
+def test_analyze_transactions_per_card_from_rollups(store, statement):
+    store.append(statement)
+
+    result = json.loads(analyze_transactions(store, "2024-07-15 12:00:00", per_card=True))
+    expected = json.loads(
+        analyze_transactions(TransactionFrame.from_raw(statement), "2024-07-15 12:00:00", per_card=True)
+    )
+
+    assert result["per_card"] == expected["per_card"]
+    assert [card["card"] for card in result["per_card"]] == ["*7197", "*5091"]
@@ -0,0 +1,164 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.top_n import IncrementalTopN, top_n, top_n_by_group, top_records
+from src.transactions import TransactionFrame
+from src.views import get_top_transactions
+
+
+@pytest.fixture
+def transactions():
+    return TransactionFrame.from_raw(
+        pd.DataFrame(
+            {
+                "Дата операции": [
+                    "01.07.2024 10:00:00",
+                    "02.07.2024 10:00:00",
+                    "03.07.2024 10:00:00",
+                    "04.07.2024 10:00:00",
+                    "28.06.2024 10:00:00",
+                    "29.06.2024 10:00:00",
+                ],
+                "Номер карты": ["*7197", "*5091", "*7197", "*5091", "*7197", "*7197"],
+                "Сумма операции": [-100.0, -50.0, -300.0, np.nan, -50.0, -10.0],
+                "Категория": ["Супермаркеты", "Кафе", "Супермаркеты", "Кафе", "Кафе", "Супермаркеты"],
+                "Описание": ["Колхоз", "Кофейня", "Магнит", None, "Кофейня", "Колхоз"],
+            }
+        )
+    ).data
+
+
+def test_top_n_matches_full_sort(transactions):
+    """Отбор без сортировки дает те же строки, что сортировка всей таблицы, NaN оказываются в конце"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({"Сумма операции": rng.integers(-20, 20, 1000).astype(float)})
+
+    for n in [1, 5, 50]:
+        expected = data.sort_values("Сумма операции", ascending=False, kind="stable").head(n)
+        assert top_n(data, n).index.tolist() == expected.index.tolist()
+
+    assert top_n(transactions, 6)["Сумма операции"].isna().tolist()[-1]
+
+
+def test_top_records(transactions):
+    records = top_records(top_n(transactions, 2))
+
+    assert records == [
+        {"date": "29.06.2024", "amount": -10.0, "category": "Супермаркеты", "description": "Колхоз"},
+        {"date": "02.07.2024", "amount": -50.0, "category": "Кафе", "description": "Кофейня"},
+    ]
+
+
+def test_top_n_by_group(transactions):
+    by_card = top_n_by_group(transactions, 2, "card")
+    by_month = top_n_by_group(transactions, 1, "month")
+
+    assert [record["amount"] for record in by_card["*7197"]] == [-10.0, -50.0]
+    assert [record["amount"] for record in by_card["*5091"]] == [-50.0]
+    assert {month: records[0]["amount"] for month, records in by_month.items()} == {
+        "2024-06": -10.0,
+        "2024-07": -50.0,
+    }
+    with pytest.raises(ValueError):
+        top_n_by_group(transactions, 2, "merchant")
+
+
+def test_get_top_transactions_groups(transactions):
+    """Один вызов возвращает общий топ и топы по группам"""
+    result = json.loads(
+        get_top_transactions(TransactionFrame(transactions), "2024-07-31 00:00:00", n=1, group_by=["category"])
+    )
+
+    assert [record["amount"] for record in result["top_transactions"]] == [-50.0]
+    assert {category: records[0]["description"] for category, records in result["top_by_category"].items()} == {
+        "Кафе": "Кофейня",
+        "Супермаркеты": "Колхоз",
+    }
+
+
+def test_incremental_top_n_matches_recomputation():
+    """Инкрементальный топ совпадает с пересчетом по всем живым операциям после добавлений, исправлений и отмен"""
+    rng = np.random.default_rng(3)
+    incremental = IncrementalTopN(n=3)
+    live = {}
+
+    for step in range(2000):
+        tx_id = int(rng.integers(0, 400))
+        action = rng.random()
+        if action < 0.1:
+            incremental.cancel(tx_id)
+            live.pop(tx_id, None)
+            continue
+
+        transaction = {
+            "Дата операции": f"{int(rng.integers(1, 29)):02d}.0{1 + step // 1000}.2024 10:00:00",
+            "Номер карты": str(rng.choice(["*7197", "*5091", "*1111"])),
+            "Сумма операции": float(rng.integers(-50, 50)),
+            "Категория": "Супермаркеты",
+            "Описание": f"операция {tx_id}",
+            "Статус": "FAILED" if action < 0.15 else "OK",
+        }
+        incremental.append(transaction, tx_id)
+        live.pop(tx_id, None)
+        if transaction["Статус"] == "OK":
+            live[tx_id] = (step, transaction)
+
+    def expected(card=None):
+        rows = [
+            (-transaction["Сумма операции"], step, transaction)
+            for step, transaction in live.values()
+            if transaction["Дата операции"][3:5] == "02" and card in (None, transaction["Номер карты"])
+        ]
+        return [transaction["Описание"] for _, _, transaction in sorted(rows, key=lambda row: row[:2])[:3]]
+
+    assert incremental.current_month == "2024-02"
+    for card in [None, "*7197", "*5091", "*1111"]:
+        assert [record["description"] for record in incremental.top(card=card)] == expected(card)
+
+
+def test_incremental_top_n_month_rollover():
+    incremental = IncrementalTopN(n=2, keep_months=1)
+    incremental.append({"Дата операции": "31.01.2024 23:00:00", "Номер карты": "*7197", "Сумма операции": 10.0})
+    incremental.append({"Дата операции": "01.02.2024 00:00:00", "Номер карты": "*7197", "Сумма операции": -5.0})
+
+    assert incremental.top() == [{"date": "01.02.2024", "amount": -5.0, "category": None, "description": None}]
+    assert incremental.top(month="2024-01") == []
+    # Операции за уже закрытый месяц не принимаются
+    incremental.append({"Дата операции": "15.01.2024 12:00:00", "Номер карты": "*7197", "Сумма операции": 1.0})
+    assert len(incremental) == 1
+
+
+def test_get_top_transactions_incremental(transactions):
+    incremental = IncrementalTopN(n=5)
+    incremental.append_frame(transactions)
+
+    result = json.loads(get_top_transactions(incremental, "2024-07-31 00:00:00", n=2))
+    expected = json.loads(get_top_transactions(TransactionFrame(transactions), "2024-07-31 00:00:00", n=2))
+
+    assert result == expected
+
+
+def test_get_top_transactions_incremental_past_date(transactions):
+    """Топ на дату внутри месяца и топ больше n структуры совпадают с расчетом по таблице"""
+    incremental = IncrementalTopN(n=1)
+    incremental.append_frame(transactions)
+
+    for date_time_str, n in [("2024-07-01 12:00:00", 1), ("2024-07-31 00:00:00", 3)]:
+        result = json.loads(get_top_transactions(incremental, date_time_str, n=n))
+        expected = json.loads(get_top_transactions(TransactionFrame(transactions), date_time_str, n=n))
+
+        assert result == expected
+
+
+def test_incremental_top_n_skips_missing_dates(transactions):
+    data = transactions.copy()
+    data.loc[0, "Дата операции"] = pd.NaT
+    incremental = IncrementalTopN(n=5)
+
+    incremental.append_frame(data)
+
+    assert len(incremental) == 4
+    assert "Колхоз" not in [record["description"] for record in incremental.top(month="2024-07")]
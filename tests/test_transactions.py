@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+from src.transactions import (TransactionFrame, as_transaction_frame, load_transactions_many, parse_dates,
+                              to_plain_frame)
+
+
+@pytest.fixture
+def raw_transactions():
+    """Сырые данные в том виде, в котором они приходят из выгрузки"""
+    return pd.DataFrame(
+        {
+            "Дата операции": ["31.12.2021 16:44:00", "30.12.2021", "2021-12-29 10:00:00", "неверная дата"],
+            "Номер карты": ["*7197", "*7197", "*5091", None],
+            "Сумма операции": ["-160,89", "-64,00", "500", ""],
+            "Категория": ["Супермаркеты", "Супермаркеты", "Пополнения", "Кафе"],
+            "MCC": [5411.0, 5411.0, None, 5812.0],
+            "Описание": ["Колхоз", "Колхоз", "Пополнение", "Кофе"],
+        }
+    )
+
+
+def test_parse_dates_tries_all_formats(raw_transactions):
+    result = parse_dates(raw_transactions["Дата операции"])
+
+    assert list(result[:3]) == [
+        pd.Timestamp("2021-12-31 16:44:00"),
+        pd.Timestamp("2021-12-30"),
+        pd.Timestamp("2021-12-29 10:00:00"),
+    ]
+    assert pd.isna(result[3])
+
+
+def test_transaction_frame_types(raw_transactions):
+    frame = TransactionFrame.from_raw(raw_transactions)
+    data = frame.data
+
+    assert pd.api.types.is_datetime64_any_dtype(data["Дата операции"])
+    assert isinstance(data["Категория"].dtype, pd.CategoricalDtype)
+    assert isinstance(data["Номер карты"].dtype, pd.CategoricalDtype)
+    assert str(data["MCC"].dtype) == "Int64"
+    assert data["Сумма операции"].tolist()[:3] == [-160.89, -64.0, 500.0]
+    assert len(frame.dropna_dates()) == 3
+
+    # Исходный DataFrame не изменяется
+    assert raw_transactions["Сумма операции"][0] == "-160,89"
+
+
+def test_as_transaction_frame_does_not_renormalize(raw_transactions):
+    frame = TransactionFrame.from_raw(raw_transactions)
+    assert as_transaction_frame(frame) is frame
+
+
+def test_to_plain_frame(raw_transactions):
+    data = TransactionFrame.from_raw(raw_transactions).data
+    result = to_plain_frame(data).to_dict(orient="records")
+
+    assert result[0]["Дата операции"] == "31.12.2021 16:44:00"
+    assert result[0]["MCC"] == 5411
+    assert result[2]["MCC"] is None
+    assert result[0]["Категория"] == "Супермаркеты"
+
+
+def test_between_matches_boolean_mask(raw_transactions):
+    frame = TransactionFrame.from_raw(raw_transactions)
+    dates = frame.data["Дата операции"]
+
+    for start, end in [
+        ("2021-12-29", "2021-12-30"),
+        ("2021-12-30", "2021-12-31 23:59:59"),
+        ("2022-01-01", "2022-02-01"),
+    ]:
+        expected = frame.data[(dates >= start) & (dates <= end)]
+        pd.testing.assert_frame_equal(frame.between(pd.Timestamp(start), pd.Timestamp(end)), expected)
+
+
+def test_date_index_is_built_once(raw_transactions):
+    frame = TransactionFrame.from_raw(raw_transactions)
+
+    assert frame.date_index is frame.date_index
+    # Строка без даты в индекс не попадает
+    assert len(frame.date_index) == 3
+
+
+def test_load_transactions_many(tmp_path, raw_transactions):
+    """Несколько файлов объединяются в порядке списка, ошибки попадают в отчет"""
+    first = str(tmp_path / "first.xlsx")
+    second = str(tmp_path / "second.xlsx")
+    raw_transactions.iloc[:2].to_excel(first, index=False)
+    raw_transactions.iloc[2:].drop(columns=["MCC"]).to_excel(second, index=False)
+    missing = str(tmp_path / "missing.xlsx")
+
+    frame, report = load_transactions_many([second, missing, first], max_workers=2, use_cache=False)
+
+    assert frame.data["Описание"].tolist() == ["Пополнение", "Кофе", "Колхоз", "Колхоз"]
+    assert frame.data["MCC"].tolist()[2:] == [5411, 5411]
+    assert isinstance(frame.data["Категория"].dtype, pd.CategoricalDtype)
+    assert [item["rows"] for item in report] == [2, 0, 2]
+    assert report[1]["error"] is not None
+    assert report[0]["error"] is None and report[0]["seconds"] >= 0
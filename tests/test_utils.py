@@ -1,9 +1,38 @@
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from unittest.mock import mock_open, patch
 
+import pytest
+import requests
 import requests_mock
 
-from src.utils import get_exchange_rates, get_load_user_setting, get_stock_prices
+from src import utils
+from src.utils import (RateLimiter, RecordingTransport, ReplayTransport, SingleFlight, StaleWhileRevalidateCache,
+                       get_exchange_rates, get_http_stats, get_load_user_setting, get_stock_prices, http_get,
+                       reload_user_settings, reset_http_stats, set_transport)
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    """Каждый тест начинает с полным лимитом запросов"""
+    monkeypatch.setattr(utils, "alphavantage_limiter", RateLimiter(utils.ALPHAVANTAGE_RATE, utils.ALPHAVANTAGE_PERIOD))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    """Повторы запросов в тестах выполняются без ожидания, счетчики начинаются с нуля"""
+    monkeypatch.setattr(utils, "HTTP_BACKOFF", 0)
+    reset_http_stats()
+
+
+@pytest.fixture(autouse=True)
+def stock_cache_dir(monkeypatch, tmp_path):
+    """Кэш котировок каждого теста лежит во временном каталоге"""
+    monkeypatch.setattr(utils, "STOCK_CACHE_DIR", str(tmp_path / "stock_cache"))
 
 
 # Тесты для get_load_user_setting
@@ -76,3 +105,233 @@ def test_get_stock_prices(mock_get_load_user_setting):
         assert prices[0]["price"] == 145.11
         assert prices[1]["stock"] == "GOOGL"
         assert prices[1]["price"] == 2700.00
+
+
+@patch("src.utils.get_load_user_setting", return_value={"user_stocks": ["AAPL", "MSFT", "GOOGL"]})
+def test_get_stock_prices_partial(mock_get_load_user_setting, monkeypatch):
+    """Ошибка по одной акции не мешает получить остальные"""
+    # Повторы ответа 500 тоже расходуют токены, лимита хватает на все попытки
+    monkeypatch.setattr(utils, "alphavantage_limiter", RateLimiter(10, utils.ALPHAVANTAGE_PERIOD))
+    url = "https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={}&apikey=key"
+    with requests_mock.Mocker() as m:
+        m.get(url.format("AAPL"), json={"Time Series (Daily)": {"2021-07-01": {"4. close": "145.11"}}})
+        m.get(url.format("MSFT"), status_code=500)
+        m.get(url.format("GOOGL"), json={"Time Series (Daily)": {"2021-07-01": {"4. close": "2700.00"}}})
+
+        prices = get_stock_prices("key", "settings.json", "2021-07-01")
+
+    assert prices == [{"stock": "AAPL", "price": 145.11}, {"stock": "GOOGL", "price": 2700.0}]
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(2, 60)
+
+    assert limiter.acquire(timeout=0)
+    assert limiter.acquire(timeout=0)
+    # Третий токен появится только через 30 секунд
+    assert not limiter.acquire(timeout=0.01)
+
+
+@patch("src.utils.get_load_user_setting", return_value={"user_stocks": ["AAPL"]})
+def test_get_stock_prices_cached(mock_get_load_user_setting):
+    """Прошедшие даты после первой загрузки отдаются из кэша без обращения к API"""
+    url = "https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol=AAPL"
+    series = {"2021-07-02": {"4. close": "146.00"}, "2021-06-30": {"4. close": "143.24"}}
+    with requests_mock.Mocker() as m:
+        m.get(url, json={"Time Series (Daily)": series})
+
+        assert get_stock_prices("key", "settings.json", "2021-07-02 12:00:00") == [{"stock": "AAPL", "price": 146.0}]
+        assert get_stock_prices("key", "settings.json", "2021-06-30") == [{"stock": "AAPL", "price": 143.24}]
+        # 2021-07-01 внутри загруженного диапазона, но без котировки: торгов не было, запрос не нужен
+        assert get_stock_prices("key", "settings.json", "2021-07-01") == []
+
+        assert m.call_count == 1
+        assert m.request_history[0].qs["outputsize"] == ["full"]
+
+
+@patch("src.utils.get_load_user_setting", return_value={"user_stocks": ["AAPL"]})
+def test_get_stock_prices_today_ttl(mock_get_load_user_setting):
+    """Котировки текущего дня перезапрашиваются после истечения TTL, догружается только хвост"""
+    today = datetime.now().strftime("%Y-%m-%d")
+    url = "https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol=AAPL"
+    with requests_mock.Mocker() as m:
+        m.get(url, json={"Time Series (Daily)": {today: {"4. close": "150.00"}}})
+
+        assert get_stock_prices("key", "settings.json", today) == [{"stock": "AAPL", "price": 150.0}]
+        assert get_stock_prices("key", "settings.json", today) == [{"stock": "AAPL", "price": 150.0}]
+        assert m.call_count == 1
+
+        get_stock_prices("key", "settings.json", today, today_ttl=0)
+        assert m.call_count == 2
+        assert m.request_history[1].qs["outputsize"] == ["compact"]
+
+
+def test_http_get_retries_and_stats():
+    """Ответ 503 повторяется, ошибки и время запросов учитываются по хостам"""
+    with requests_mock.Mocker() as m:
+        m.get("https://example.com/data", [{"status_code": 503}, {"status_code": 503}, {"json": {"ok": True}}])
+        m.get("https://example.org/missing", status_code=404)
+
+        assert http_get("https://example.com/data").json() == {"ok": True}
+        assert http_get("https://example.org/missing").status_code == 404
+
+    stats = get_http_stats()
+    assert stats["example.com"]["requests"] == 3
+    assert stats["example.com"]["errors"] == 2
+    # 404 не повторяется
+    assert stats["example.org"]["requests"] == 1
+    assert stats["example.org"]["avg_seconds"] >= 0
+
+
+def test_http_get_gives_up_after_retries():
+    with requests_mock.Mocker() as m:
+        m.get("https://example.com/data", exc=requests.exceptions.ConnectTimeout)
+
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            http_get("https://example.com/data", retries=2)
+
+    stats = get_http_stats()["example.com"]
+    assert (stats["requests"], stats["errors"]) == (3, 3)
+
+
+def test_http_get_retries_take_limiter_tokens():
+    """Каждый повтор забирает токен лимитера, без токена запрос не отправляется"""
+    limiter = RateLimiter(2, 60)
+    with requests_mock.Mocker() as m:
+        m.get("https://example.com/data", status_code=503)
+
+        with pytest.raises(requests.exceptions.RetryError):
+            http_get("https://example.com/data", limiter=limiter, limiter_timeout=0)
+
+        assert m.call_count == 2
+
+
+def test_http_get_long_retry_after():
+    """Ответ 429 с долгим Retry-After не повторяется"""
+    with requests_mock.Mocker() as m:
+        m.get("https://example.com/data", status_code=429, headers={"Retry-After": "120"})
+
+        assert http_get("https://example.com/data").status_code == 429
+        assert m.call_count == 1
+
+
+def test_get_load_user_setting_cached(tmp_path):
+    """Файл перечитывается только после изменения, после перечитывания вызываются обработчики"""
+    settings_path = tmp_path / "user_settings.json"
+    settings_path.write_text(json.dumps({"user_stocks": ["AAPL"]}), encoding="utf-8")
+    reloaded = []
+    utils.add_settings_reload_hook(lambda path, settings: reloaded.append(settings))
+
+    try:
+        assert get_load_user_setting(str(settings_path)) == {"user_stocks": ["AAPL"]}
+        with patch("builtins.open", side_effect=AssertionError("файл не должен читаться")):
+            assert get_load_user_setting(str(settings_path)) == {"user_stocks": ["AAPL"]}
+
+        settings_path.write_text(json.dumps({"user_stocks": ["AAPL", "MSFT"]}), encoding="utf-8")
+        os.utime(settings_path, ns=(0, 10**18))
+        assert get_load_user_setting(str(settings_path)) == {"user_stocks": ["AAPL", "MSFT"]}
+        assert reloaded == [{"user_stocks": ["AAPL", "MSFT"]}]
+    finally:
+        utils._settings_reload_hooks.clear()
+        reload_user_settings()
+
+
+def test_stale_while_revalidate_cache():
+    """Устаревшее значение отдается сразу и обновляется в фоне, слишком старое загружается заново"""
+    cache = StaleWhileRevalidateCache(fresh_ttl=10, max_stale=100)
+    values = iter([["v1"], ["v2"], [], ["v3"]])
+    loader = lambda: next(values)  # noqa: E731
+
+    assert cache.get("key", loader) == (["v1"], 0.0)
+
+    # Значение устарело, но еще допустимо: отдается старое, новое загружается в фоне
+    cache.entries["key"] = (time.time() - 50, ["v1"])
+    value, age = cache.get("key", loader)
+    assert value == ["v1"] and age == pytest.approx(50, abs=1)
+    deadline = time.time() + 5
+    while cache.entries["key"][1] != ["v2"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get("key", loader)[0] == ["v2"]
+
+    # Пустой ответ API не затирает последнее известное значение
+    cache.entries["key"] = (time.time() - 500, ["v2"])
+    assert cache.get("key", loader) == ([], None)
+    assert cache.entries["key"][1] == ["v2"]
+    assert cache.get("key", loader, max_stale=1000)[0] == ["v2"]
+
+
+def test_single_flight_coalesces_calls():
+    """Одновременные вызовы с одним ключом выполняются один раз и получают общий результат"""
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def slow_fetch(symbol):
+        calls.append(symbol)
+        started.set()
+        release.wait(5)
+        return 145.11
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        leader = executor.submit(single_flight.do, ("TIME_SERIES_DAILY", "AAPL", "2021-07-01"), slow_fetch, "AAPL")
+        started.wait(5)
+        followers = [
+            executor.submit(single_flight.do, ("TIME_SERIES_DAILY", "AAPL", "2021-07-01"), slow_fetch, "AAPL")
+            for _ in range(3)
+        ]
+        while single_flight.get_stats()["TIME_SERIES_DAILY"]["calls"] < 4:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [future.result() for future in followers]
+
+    assert results == [145.11] * 4
+    assert calls == ["AAPL"]
+    assert single_flight.get_stats() == {"TIME_SERIES_DAILY": {"calls": 4, "executed": 1, "saved": 3}}
+
+    # После завершения вызова следующий выполняется заново
+    assert single_flight.do(("TIME_SERIES_DAILY", "AAPL", "2021-07-01"), slow_fetch, "AAPL") == 145.11
+    assert calls == ["AAPL", "AAPL"]
+
+
+@pytest.fixture
+def restore_transport(monkeypatch):
+    """Транспорт, установленный в тесте, заменяется обратно после теста"""
+    monkeypatch.setattr(utils, "_transport", utils.get_transport())
+
+
+@patch("src.utils.get_load_user_setting", return_value={"user_stocks": ["AAPL", "GOOGL"]})
+def test_record_and_replay_transport(mock_get_load_user_setting, restore_transport, tmp_path, monkeypatch):
+    """Записанные ответы воспроизводятся без сети, задержка и ошибки задаются транспортом"""
+    records = str(tmp_path / "records")
+    url = "https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={}"
+
+    set_transport(RecordingTransport(records))
+    with requests_mock.Mocker() as m:
+        m.get(url.format("AAPL"), json={"Time Series (Daily)": {"2021-07-01": {"4. close": "145.11"}}})
+        m.get(url.format("GOOGL"), json={"Time Series (Daily)": {"2021-07-01": {"4. close": "2700.00"}}})
+        recorded = get_stock_prices("secret_key", "settings.json", "2021-07-01")
+    # Ключ API не сохраняется в записях
+    assert all("secret_key" not in path.read_text(encoding="utf-8") for path in (tmp_path / "records").iterdir())
+
+    monkeypatch.setattr(utils, "STOCK_CACHE_DIR", str(tmp_path / "replay_cache"))
+    set_transport(ReplayTransport(records, latency=0.05))
+    reset_http_stats()
+    assert get_stock_prices("other_key", "settings.json", "2021-07-01") == recorded
+    assert get_http_stats()["www.alphavantage.co"]["avg_seconds"] >= 0.05
+
+
+def test_replay_transport_errors(restore_transport, tmp_path):
+    set_transport(ReplayTransport(str(tmp_path), error_rate=1.0, error_status=503))
+    assert http_get("https://example.com/data", retries=1).status_code == 503
+    assert get_http_stats()["example.com"]["errors"] == 2
+
+    # Задержка больше таймаута ведет себя как таймаут запроса
+    set_transport(ReplayTransport(str(tmp_path), latency=0.2))
+    with pytest.raises(requests.exceptions.Timeout):
+        http_get("https://example.com/data", timeout=0.01, retries=0)
+
+    # Ответа нет в записях
+    set_transport(ReplayTransport(str(tmp_path)))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        http_get("https://example.com/data", retries=0)
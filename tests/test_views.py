@@ -1,9 +1,12 @@
 import json
+import threading
+import time
 
 import pandas as pd
 import pytest
 
-from src.views import analyze_transactions, get_greeting, get_top_transactions, main_first
+from src.transactions import TransactionFrame
+from src.views import analyze_transactions, analyze_transactions_chunks, get_greeting, get_top_transactions, main_first
 
 
 # Тест для get_greeting
@@ -77,6 +80,38 @@ def test_analyze_transactions_missing_card_numbers():
     assert json.loads(result) == expected_result
 
 
+# Тест потокового анализа: результат совпадает с анализом всего DataFrame
+def test_analyze_transactions_chunks():
+    df = pd.DataFrame(
+        {
+            "Номер карты": ["1234567812345678", "8765432187654321", "1234567812345678"],
+            "Сумма операции": [-100.00, -200.00, 50.00],
+        }
+    )
+    chunks = [df.iloc[:2].copy(), df.iloc[2:].copy()]
+
+    result = analyze_transactions_chunks(chunks, "2023-07-04")
+
+    assert json.loads(result) == json.loads(analyze_transactions(df.copy(), "2023-07-04"))
+    assert json.loads(result) == {"last_digits": "5678", "total_spent": 300.0, "cashback": 3.0}
+
+
+def test_analyze_transactions_transaction_frame():
+    df = pd.DataFrame(
+        {
+            "Номер карты": ["1234567812345678", "8765432187654321", "1234567812345678"],
+            "Сумма операции": ["-100,00", "-200,00", "50,00"],
+        }
+    )
+    result = analyze_transactions(TransactionFrame.from_raw(df), "2023-07-04")
+    assert json.loads(result) == {"last_digits": "5678", "total_spent": 300.0, "cashback": 3.0}
+
+
+def test_analyze_transactions_chunks_no_data():
+    result = analyze_transactions_chunks(iter([]), "2023-07-04")
+    assert json.loads(result) == {"error": "Нет данных для анализа"}
+
+
 # Тест для get_top_transactions
 transactions_data = pd.DataFrame(
     {
@@ -124,6 +159,22 @@ def test_get_top_transactions_invalid_date_format():
     assert json.loads(result) == expected_result
 
 
+# Нормализованные данные с датами в формате выгрузки
+def test_get_top_transactions_transaction_frame():
+    df = transactions_data.copy()
+    df["Дата операции"] = pd.to_datetime(df["Дата операции"]).dt.strftime("%d.%m.%Y %H:%M:%S")
+
+    result = json.loads(get_top_transactions(TransactionFrame.from_raw(df), "2024-07-20 18:00:00"))
+
+    assert [item["amount"] for item in result["top_transactions"]] == [400.0, 300.0, 200.0, 150.0, 50.0]
+    assert result["top_transactions"][0] == {
+        "date": "20.07.2024",
+        "amount": 400.0,
+        "category": "Развлечения",
+        "description": "Билет в кино",
+    }
+
+
 # Тест для main_first
 @pytest.fixture
 def mock_dependencies(mocker):
@@ -191,3 +242,111 @@ def test_main_first(mock_dependencies, sample_df):
     result_dict = json.loads(result)
 
     assert result_dict == expected_result
+
+
+def test_main_first_section_timeout(mock_dependencies, mocker, sample_df):
+    """Медленная сетевая секция не задерживает ответ: она пропускается, остальные данные возвращаются"""
+
+    def slow_rates():
+        time.sleep(1)
+        return [{"currency": "USD", "rate": 1.1}]
+
+    mocker.patch("src.views.get_exchange_rates", side_effect=slow_rates)
+
+    started = time.monotonic()
+    result = json.loads(main_first(sample_df, "2024-07-23 14:30:00", section_timeouts={"currency_rates": 0.1}))
+
+    assert time.monotonic() - started < 0.9
+    assert result["currency_rates"] == []
+    assert result["stock_prices"] == [{"symbol": "AAPL", "price": 150.0}, {"symbol": "GOOGL", "price": 2800.0}]
+    assert result["greeting"] == "Добрый день"
+
+
+def test_main_first_abandoned_sections_do_not_block(mock_dependencies, mocker, sample_df):
+    """Секции, брошенные по таймауту, не занимают потоки следующих вызовов main_first"""
+    upstream_down = threading.Event()
+    upstream_down.set()
+    released = threading.Event()
+
+    def rates(*args, **kwargs):
+        # Запросы, начатые во время сбоя, зависают до конца теста
+        if upstream_down.is_set():
+            released.wait(5)
+        return [{"currency": "USD", "rate": 1.1}]
+
+    mocker.patch("src.views.get_exchange_rates", side_effect=rates)
+    mocker.patch("src.views.get_stock_prices", side_effect=rates)
+
+    try:
+        for _ in range(3):
+            result = json.loads(main_first(sample_df, "2024-07-23 14:30:00", deadline=0.05))
+            assert result["currency_rates"] == []
+
+        # После восстановления сервиса следующий вызов получает данные в пределах своего дедлайна
+        upstream_down.clear()
+        result = json.loads(main_first(sample_df, "2024-07-23 14:30:00", deadline=1))
+
+        assert result["currency_rates"] == [{"currency": "USD", "rate": 1.1}]
+        assert result["stock_prices"] == [{"currency": "USD", "rate": 1.1}]
+    finally:
+        released.set()
+
+
+def test_main_first_section_error(mock_dependencies, mocker, sample_df):
+    mocker.patch("src.views.get_stock_prices", side_effect=RuntimeError("quota"))
+
+    result = json.loads(main_first(sample_df, "2024-07-23 14:30:00"))
+
+    assert result["stock_prices"] == []
+    assert result["currency_rates"] == [{"currency": "USD", "rate": 1.1}, {"currency": "EUR", "rate": 0.9}]
+
+
+def test_main_first_stale_while_revalidate(mock_dependencies, mocker, sample_df):
+    """В режиме stale-while-revalidate ответ содержит возраст сетевых данных"""
+    rates = mocker.patch("src.views.get_exchange_rates_swr", return_value=([{"currency": "USD", "rate": 1.1}], 120.04))
+    stocks = mocker.patch("src.views.get_stock_prices_swr", return_value=([], None))
+
+    result = json.loads(main_first(sample_df, "2024-07-23 14:30:00", stale_while_revalidate=True, max_stale=600))
+
+    # Допустимый возраст данных передается в оба кэша
+    rates.assert_called_once_with(600)
+    assert stocks.call_args.kwargs["max_stale"] == 600
+
+    assert result["currency_rates"] == [{"currency": "USD", "rate": 1.1}]
+    assert result["stock_prices"] == []
+    assert result["data_age"] == {"currency_rates": 120.0, "stock_prices": None}
+
+
+def test_analyze_transactions_per_card():
+    """Разбивка по картам считается за один проход, для сырых и нормализованных данных одинаково"""
+    df = pd.DataFrame(
+        {
+            "Номер карты": ["*7197", "*5091", "*7197", None, "*5091", "*7197"],
+            "Сумма операции": [-100.0, -250.5, 500.0, -40.0, -49.5, -200.0],
+        }
+    )
+
+    raw = json.loads(analyze_transactions(df.copy(), "2024-07-15 12:00:00", per_card=True))
+    normalized = json.loads(analyze_transactions(TransactionFrame.from_raw(df), "2024-07-15 12:00:00", per_card=True))
+
+    assert raw["per_card"] == normalized["per_card"]
+    assert normalized["per_card"] == [
+        {
+            "card": "*5091",
+            "last_digits": "5091",
+            "total_spent": 300.0,
+            "income": 0.0,
+            "cashback": 3.0,
+            "operations": 2,
+        },
+        {
+            "card": "*7197",
+            "last_digits": "7197",
+            "total_spent": 300.0,
+            "income": 500.0,
+            "cashback": 3.0,
+            "operations": 3,
+        },
+    ]
+    # Без флага ответ не меняется
+    assert "per_card" not in json.loads(analyze_transactions(TransactionFrame.from_raw(df), "2024-07-15 12:00:00"))